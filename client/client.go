@@ -5,6 +5,7 @@ import (
         "flag"
         "fmt"
         "bytes"
+        "compress/gzip"
         "io/ioutil"
         "net/http"
         "encoding/json"
@@ -16,12 +17,24 @@ var deployment = flag.String("deployment", empty, "Optional. To separate differe
 var application = flag.String("application", empty, "Application")
 var version = flag.String("version", empty, "Version number")
 var host = flag.String("host", empty, "Hostname")
+var compress = flag.Bool("gzip", false, "Optional. Send the report gzip compressed.")
 
 
 func send(url *string, data map[string]string) {
   jsonStr, err := json.Marshal(data)
-  req, err := http.NewRequest("POST", *url, bytes.NewBuffer(jsonStr))
+  var payload bytes.Buffer
+  if (*compress) {
+    writer := gzip.NewWriter(&payload)
+    writer.Write(jsonStr)
+    writer.Close()
+  } else {
+    payload.Write(jsonStr)
+  }
+  req, err := http.NewRequest("POST", *url, &payload)
   req.Header.Set("Content-Type", "application/json")
+  if (*compress) {
+    req.Header.Set("Content-Encoding", "gzip")
+  }
 
   client := &http.Client{}
   resp, err := client.Do(req)
@@ -61,7 +74,7 @@ func main() {
   data = make(map[string]string)
   data["host"] = *host
   if (*deployment != empty) {
-    data["deployment"] = *cluster
+    data["deployment"] = *deployment
   }
   data["application"] = *application
   data["version"] = *version
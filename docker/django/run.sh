@@ -4,4 +4,11 @@
 cd /opt/app
 pip install -r /opt/requirements.txt
 python manage.py migrate
+
+# Shared by the django and celery processes to aggregate the metrics
+export prometheus_multiproc_dir=/tmp/prometheus
+rm -rf $prometheus_multiproc_dir
+mkdir -p $prometheus_multiproc_dir
+chmod 777 $prometheus_multiproc_dir
+
 supervisord -n
@@ -0,0 +1,83 @@
+"""Response cache for reads, kept in redis.
+
+Keys include the inventory generation, so every write makes the cached
+responses unreachable and they expire after VERSION_RESPONSE_CACHE_TTL
+seconds without any purge. Responses are shared by the users of the same
+permission class, except HTML pages, which show who is logged in.
+"""
+import json
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.http import HttpResponse
+
+from version import store, generation, permissions
+
+
+def permission_class(request):
+    user = request.user
+    if user.is_superuser:
+        return 'superuser'
+    if permissions.IsRegistered()._is_valid_email(request):
+        return 'registered'
+    return 'anonymous'
+
+
+def response_key(request, per_user=False):
+    value = generation.current()
+    if value is None:
+        return None
+    accept = request.META.get('HTTP_ACCEPT', '')
+    if per_user or 'text/html' in accept:
+        scope = 'user:%s' % request.user.pk
+    else:
+        scope = permission_class(request)
+    # Cached bodies hold absolute urls built from the host and scheme
+    key = '%s %s %s %s' % (value, scope, request.build_absolute_uri(), accept)
+    return 'response:' + hashlib.sha1(key.encode()).hexdigest()
+
+
+def dump(response):
+    return json.dumps({
+        'content': response.content.decode(response.charset),
+        'content_type': response['Content-Type'],
+    })
+
+
+def load(value):
+    data = json.loads(value)
+    return HttpResponse(data['content'], content_type=data['content_type'])
+
+
+def save(key, response):
+    if response.status_code == 200 and not response.streaming:
+        store.set_many({key: dump(response)},
+                       settings.VERSION_RESPONSE_CACHE_TTL)
+
+
+def cache_response(view=None, per_user=False):
+    """Caches the successful responses of a view per inventory generation."""
+    if view is None:
+        return lambda view: cache_response(view, per_user)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = None
+        # Pages with pending messages show them only once
+        if request.method in ('GET', 'HEAD') and not len(
+                messages.get_messages(request)):
+            key = response_key(request, per_user)
+        if key is None:
+            return view(request, *args, **kwargs)
+        cached = store.get_many([key])[0]
+        if cached is not None:
+            return load(cached)
+        response = view(request, *args, **kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.add_post_render_callback(lambda r: save(key, r))
+        else:
+            save(key, response)
+        return response
+    return wrapper
@@ -0,0 +1,69 @@
+"""Differences in the applications run by two clusters, deployments or
+releases.
+
+Each side is read as distinct (application, version) pairs: from the
+VersionCount matrix for clusters and deployments, and from the services of
+a release otherwise. Only those pairs leave the database.
+"""
+from collections import defaultdict
+
+from django.http import Http404
+
+from version import models
+
+# Every kind of target is given by name, except releases, by id. Cluster
+# names are not unique: all the clusters with the name are compared.
+KINDS = {
+    'cluster': (models.Cluster, 'name', 'cluster__name'),
+    'deployment': (models.Deployment, 'name', 'deployment__name'),
+    'release': (models.Release, 'pk', 'releases'),
+}
+
+
+def lookup(kind, value):
+    """The filter of the rows of `value`; Http404 when it does not exist."""
+    model, field, rows = KINDS[kind]
+    try:
+        found = model.objects.filter(**{field: value}).exists()
+    except ValueError:
+        found = False
+    if not found:
+        raise Http404('No %s %s' % (kind, value))
+    return {rows: value}
+
+
+def pairs(kind, target):
+    """The distinct (application, version) names of the `target` filter."""
+    if kind == 'release':
+        rows = (models.Service.objects.filter(**target)
+                .values_list('component__application__name',
+                             'component__version__name'))
+    else:
+        rows = (models.VersionCount.objects.filter(**target)
+                .values_list('application__name', 'version__name'))
+    return rows.distinct().order_by()
+
+
+def versions(kind, target):
+    """Sorted versions of every application of `target`."""
+    found = defaultdict(set)
+    for application, version in pairs(kind, target):
+        found[application].add(version)
+    return dict((application, sorted(names))
+                for application, names in found.items())
+
+
+def diff(kind, left, right):
+    """Applications added, removed or with other versions from left to right.
+    """
+    before, after = versions(kind, left), versions(kind, right)
+    return {
+        'added': [{'application': name, 'versions': after[name]}
+                  for name in sorted(set(after) - set(before))],
+        'removed': [{'application': name, 'versions': before[name]}
+                    for name in sorted(set(before) - set(after))],
+        'changed': [{'application': name, 'left': before[name],
+                     'right': after[name]}
+                    for name in sorted(set(before) & set(after))
+                    if before[name] != after[name]],
+    }
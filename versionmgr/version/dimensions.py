@@ -0,0 +1,82 @@
+"""Process-local cache of dimension primary keys used by the ingestion.
+
+Hosts, applications, versions, deployments and components are looked up by
+name on every report but they are almost never renamed or removed. Any such
+change bumps a generation counter in redis, so every worker drops its cache
+before processing the next batch.
+"""
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from version import models, store
+
+GENERATION = 'dimensions'
+
+MODELS = (
+    models.Host,
+    models.Application,
+    models.Version,
+    models.Deployment,
+    models.Component,
+)
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.generation = None
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+cache = LRUCache(settings.VERSION_DIMENSION_CACHE_SIZE)
+
+
+def validate():
+    """Drops the cache if another process changed any dimension.
+
+    Without redis there is no way to know, so the cache is not used at all.
+    """
+    generation = store.get_generation(GENERATION)
+    if generation is None or generation != cache.generation:
+        cache.clear()
+    cache.generation = generation
+
+
+def enabled():
+    return cache.generation is not None
+
+
+def invalidate(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    cache.clear()
+    transaction.on_commit(lambda: store.bump_generation(GENERATION))
+
+
+for model in MODELS:
+    post_save.connect(invalidate, sender=model,
+                      dispatch_uid='dimensions-save-%s' % model.__name__)
+    post_delete.connect(invalidate, sender=model,
+                        dispatch_uid='dimensions-delete-%s' % model.__name__)
@@ -0,0 +1,72 @@
+"""Flat export of the whole inventory as NDJSON or CSV.
+
+Django 1.10 has no server-side cursors (`iterator(chunk_size=...)` came in
+1.11) and psycopg2 loads whole result sets into memory, so rows are read in
+keyset chunks on the service id instead. Memory use depends only on the
+chunk size, whatever the size of the inventory.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from version import models
+
+COLUMNS = (
+    'host', 'cluster', 'deployment', 'application', 'version', 'arguments',
+    'updated',
+)
+LOOKUPS = (
+    'host__name', 'host__cluster__name', 'deployment__name',
+    'component__application__name', 'component__version__name',
+    'arguments', 'updated',
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def rows(chunk_size=None):
+    """Yields every service as a tuple of COLUMNS, in id order."""
+    chunk_size = chunk_size or settings.VERSION_EXPORT_CHUNK_SIZE
+    last = 0
+    while True:
+        chunk = list(models.Service.objects
+                     .filter(pk__gt=last)
+                     .order_by('pk')
+                     .values_list('pk', *LOOKUPS)[:chunk_size])
+        for row in chunk:
+            yield row[1:-1] + (row[-1].isoformat(), )
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][0]
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row))) + '\n'
+
+
+class Echo(object):
+    """File-like object that returns what is written to it."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
+
+
+def lines(kind, chunk_size=None):
+    return FORMATS[kind](rows(chunk_size))
@@ -0,0 +1,116 @@
+"""Read-only list rendering straight from `.values()` rows.
+
+Builds the same documents as ServiceWithDepsSerializer without model
+instances, field introspection or a reverse() per url, and encodes them
+with ujson when it is installed.
+"""
+import json
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
+from rest_framework.fields import DateTimeField
+
+from version import models
+
+try:
+    import ujson
+except ImportError:  # ujson is optional
+    ujson = None
+
+SERVICE_COLUMNS = (
+    'id', 'updated', 'stale', 'arguments',
+    'host_id', 'host__name', 'host__label',
+    'component_id',
+    'component__application_id', 'component__application__name',
+    'component__application__label', 'component__application__description',
+    'component__version_id', 'component__version__name',
+    'deployment_id', 'deployment__name', 'deployment__label',
+)
+
+PLACEHOLDER = '00000'
+
+
+def dumps(data):
+    if ujson is not None:
+        return ujson.dumps(data, ensure_ascii=False,
+                           escape_forward_slashes=False)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def url_template(request, view_name):
+    """The absolute url of `view_name` with a %s in place of the pk."""
+    url = request.build_absolute_uri(
+        reverse(view_name, kwargs={'pk': PLACEHOLDER}))
+    return url.replace('%', '%%').replace(PLACEHOLDER, '%s')
+
+
+def attributes(model, pks):
+    """Serialized attributes of every object, by object id."""
+    found = defaultdict(list)
+    rows = (models.Attribute.objects
+            .filter(content_type=ContentType.objects.get_for_model(model),
+                    object_id__in=set(pks))
+            .order_by('pk')
+            .values_list('object_id', 'id', 'name', 'value'))
+    for object_id, pk, name, value in rows:
+        found[object_id].append({'id': pk, 'name': name, 'value': value})
+    return found
+
+
+def service_rows(rows, request):
+    urls = dict(
+        (name, url_template(request, '%s-detail' % name))
+        for name in ('service', 'host', 'component', 'application',
+                     'version', 'deployment')
+    )
+    updated = DateTimeField().to_representation
+    host_attributes = attributes(
+        models.Host, (row['host_id'] for row in rows))
+    application_attributes = attributes(
+        models.Application, (row['component__application_id'] for row in rows))
+
+    result = []
+    for row in rows:
+        host = row['host_id']
+        application = row['component__application_id']
+        version = row['component__version_id']
+        deployment = row['deployment_id']
+        result.append({
+            'url': urls['service'] % row['id'],
+            'id': row['id'],
+            'updated': updated(row['updated']),
+            'stale': row['stale'],
+            'arguments': row['arguments'],
+            'host': {
+                'url': urls['host'] % host,
+                'id': host,
+                'name': row['host__name'],
+                'label': row['host__label'],
+                'attributes': host_attributes.get(host, []),
+            },
+            'component': {
+                'url': urls['component'] % row['component_id'],
+                'id': row['component_id'],
+                'application': {
+                    'url': urls['application'] % application,
+                    'id': application,
+                    'name': row['component__application__name'],
+                    'label': row['component__application__label'],
+                    'description': row['component__application__description'],
+                    'attributes': application_attributes.get(application, []),
+                },
+                'version': {
+                    'url': urls['version'] % version,
+                    'id': version,
+                    'name': row['component__version__name'],
+                },
+            },
+            'deployment': deployment and {
+                'url': urls['deployment'] % deployment,
+                'id': deployment,
+                'name': row['deployment__name'],
+                'label': row['deployment__label'],
+            },
+        })
+    return result
@@ -0,0 +1,51 @@
+"""Generation of the inventory: a counter in redis bumped on every change.
+
+Readers validate conditional requests and cached responses against it
+without touching the database. Ingestion bumps it explicitly, because its
+bulk statements send no signals; model signals cover every other write.
+"""
+from datetime import datetime
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils import timezone
+
+from version import store
+
+NAME = 'inventory'
+TIME_KEY = 'generation:%s:time' % NAME
+
+
+def bump():
+    """Bumps the generation once the current transaction commits."""
+    transaction.on_commit(lambda: store.bump_generation(NAME, TIME_KEY))
+
+
+def current():
+    """The generation, or None when redis is not available."""
+    return store.get_generation(NAME)
+
+
+def modified():
+    """When the generation was last bumped, or None if unknown."""
+    value = store.get_many([TIME_KEY])[0]
+    if value is None:
+        return None
+    return datetime.fromtimestamp(float(value), timezone.utc)
+
+
+def changed(sender, **kwargs):
+    bump()
+
+
+for model in apps.get_app_config('version').get_models():
+    if model.__name__ == 'VersionCount':
+        # Derived data, only written along with the services it counts
+        continue
+    uid = 'generation-%s' % model.__name__
+    post_save.connect(changed, sender=model, dispatch_uid=uid + '-save')
+    post_delete.connect(changed, sender=model, dispatch_uid=uid + '-delete')
+    for field in model._meta.many_to_many:
+        m2m_changed.connect(changed, sender=field.remote_field.through,
+                            dispatch_uid=uid + '-' + field.name)
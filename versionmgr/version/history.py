@@ -0,0 +1,40 @@
+"""Queries and retention of the VersionChange history."""
+from django.db.models import Max
+
+from version import models
+
+
+def running_at(host, when):
+    """The last change of every deployment of `host` before `when`."""
+    changes = models.VersionChange.objects.filter(host=host, created__lte=when)
+    latest = (changes.values('deployment')
+              .annotate(last=Max('pk'))
+              .values_list('last', flat=True))
+    return (models.VersionChange.objects
+            .filter(pk__in=list(latest))
+            .select_related('host', 'deployment', 'application', 'version',
+                            'previous')
+            .order_by('deployment__name'))
+
+
+def compact(cutoff, chunk_size):
+    """Removes the changes older than `cutoff`.
+
+    The last old change of every host and deployment is kept, because it
+    tells what was running from then on. Returns how many were removed.
+    """
+    old = models.VersionChange.objects.filter(created__lt=cutoff)
+    keep = set(old.values('host', 'deployment')
+               .annotate(last=Max('pk'))
+               .values_list('last', flat=True))
+    removed = last = 0
+    while True:
+        pks = list(old.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return removed
+        last = pks[-1]
+        pks = [pk for pk in pks if pk not in keep]
+        if pks:
+            removed += (models.VersionChange.objects
+                        .filter(pk__in=pks).delete()[0])
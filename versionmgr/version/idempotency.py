@@ -0,0 +1,58 @@
+"""Drops duplicate deliveries of agent reports at the web tier.
+
+Agents retry their POSTs after timeouts. Retries are recognized by the
+Idempotency-Key header of the request or by the `report_id` of every report:
+the first delivery claims the key in redis for VERSION_IDEMPOTENCY_TTL seconds
+and later ones are dropped before reaching the broker. Keys are stored hashed,
+so every entry has the same small size whatever the clients send. Without
+redis every delivery is accepted.
+"""
+import hashlib
+
+from django.conf import settings
+
+from version import store
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def key_name(key):
+    return 'idempotency:' + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def request_key(request):
+    return request.META.get(HEADER, '').strip() or None
+
+
+def report_key(report):
+    if not isinstance(report, dict) or report.get('report_id') is None:
+        return None
+    return 'report:%s' % report['report_id']
+
+
+def claim(keys):
+    """Returns whether each key is delivered for the first time."""
+    return store.claim_many([key_name(key) for key in keys],
+                            settings.VERSION_IDEMPOTENCY_TTL)
+
+
+def release(keys):
+    """Forgets keys whose delivery failed, so the retries are accepted."""
+    store.delete_many(key_name(key) for key in keys)
+
+
+def fresh_reports(reports):
+    """Drops the reports whose report_id was already delivered.
+
+    Returns them together with the keys claimed for them.
+    """
+    keys = [report_key(report) for report in reports]
+    claimed = iter(claim(key for key in keys if key))
+    fresh, claimed_keys = [], []
+    for report, key in zip(reports, keys):
+        if key is None:
+            fresh.append(report)
+        elif next(claimed):
+            fresh.append(report)
+            claimed_keys.append(key)
+    return fresh, claimed_keys
@@ -0,0 +1,32 @@
+"""Customers affected by an application, at a version or a version range.
+
+The whole Customer -> Deployment -> Service -> Component walk is a single
+aggregated query, with one row per affected customer.
+"""
+from django.db.models import Count, Q
+
+from version import models
+
+# Path from a customer to the versions of its services
+VERSION = 'deployments__services__component__version'
+
+
+def customers(application, version=None, condition=Q()):
+    """Counts of the deployments, hosts and services of every customer
+    running `application`, optionally at `version` and matching `condition`,
+    a Q on the paths below VERSION.
+    """
+    lookups = {'deployments__services__component__application__name':
+               application}
+    if version is not None:
+        lookups[VERSION + '__name'] = version
+    return (models.Customer.objects
+            .filter(condition, **lookups)
+            .annotate(deployment_count=Count('deployments', distinct=True),
+                      host_count=Count('deployments__services__host',
+                                       distinct=True),
+                      service_count=Count('deployments__services',
+                                          distinct=True))
+            .order_by('-service_count', 'name')
+            .values('id', 'name', 'deployment_count', 'host_count',
+                    'service_count'))
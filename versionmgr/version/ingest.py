@@ -0,0 +1,697 @@
+import json
+import time
+from datetime import datetime
+import logging
+import hashlib
+
+from django.conf import settings
+from django.db import (transaction, IntegrityError, OperationalError,
+                       InterfaceError)
+from django.db.models import Case, When, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_save, post_save, pre_delete
+from django.utils import timezone
+
+from version import (models, store, dimensions, upsert, metrics, generation,
+                     matrix)
+
+logger = logging.getLogger(__name__)
+
+# Keeps IN (...) lists and CASE expressions below SQLite's variable limit.
+BATCH_SIZE = 400
+
+# Redis list used by the "batch" ingestion mode.
+QUEUE = 'reports'
+POLL_INTERVAL = 0.02
+# Reports taken by the running drain, until they are saved.
+PROCESSING_QUEUE = 'reports:processing'
+DRAIN_LOCK = 'reports:lock'
+# When a report was queued, in seconds since the epoch.
+QUEUED_KEY = '_queued'
+# Queued reports that kept failing end up in this list, until they are
+# moved back with the requeue_failed_reports command.
+FAILED_QUEUE = 'reports:failed'
+# Times a queued report is tried on its own before giving up on it, counted
+# in a hash by report.
+MAX_ATTEMPTS = 3
+ATTEMPTS = 'reports:attempts'
+# Errors of the database itself, rather than of the reports saved.
+UNAVAILABLE = (OperationalError, InterfaceError)
+
+# Names may be reported as numbers, like "version": 1.2, and are stored as
+# text. Booleans are ints too, but never names.
+NAME_TYPES = (str, int, float, type(None))
+# Every name is stored in a column of this size.
+NAME_LENGTH = models.Host._meta.get_field('name').max_length
+
+# Concurrent workers may insert the same new names; the loser retries.
+INTEGRITY_RETRIES = 3
+
+
+class InvalidReport(ValueError):
+    pass
+
+
+def parse_reports(body):
+    """Accepts a JSON array of reports or one JSON report per line."""
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    text = text.strip()
+    if not text:
+        return []
+    try:
+        if text.startswith('['):
+            reports = json.loads(text)
+        else:
+            reports = [json.loads(line) for line in text.splitlines()
+                       if line.strip()]
+    except ValueError as e:
+        raise InvalidReport('Malformed report: %s' % e)
+    for report in reports:
+        validate_report(report)
+    return reports
+
+
+def validate_report(report):
+    if not isinstance(report, dict):
+        raise InvalidReport('Expected an object, but got %s' % report)
+    for key in ('application', 'version'):
+        if not report.get(key):
+            raise InvalidReport('Report without %s: %s' % (key, report))
+    for key in ('host', 'application', 'version', 'deployment'):
+        if (isinstance(report.get(key), bool) or
+                not isinstance(report.get(key), NAME_TYPES)):
+            raise InvalidReport('%s is not a name: %s' % (key, report))
+        if len(str(report.get(key) or '')) > NAME_LENGTH:
+            raise InvalidReport('%s longer than %s characters: %s'
+                                % (key, NAME_LENGTH, report))
+
+
+class NDJSONReader(object):
+    """Iterates over the reports of a stream with one JSON report per line.
+
+    Invalid lines are logged and counted in `rejected` instead of aborting
+    the whole upload.
+    """
+    def __init__(self, stream, max_line_length=None):
+        self.stream = stream
+        self.max_line_length = (max_line_length or
+                                settings.VERSION_INGEST_MAX_LINE_LENGTH)
+        self.rejected = 0
+
+    def lines(self):
+        """Yields the lines of the stream, or None for the ones too long."""
+        limit = self.max_line_length
+        while True:
+            line = self.stream.readline(limit + 1)
+            if not line:
+                return
+            if len(line) <= limit:
+                yield line
+                continue
+            # Skip the rest of the line without keeping it in memory
+            while line and not line.endswith(b'\n'):
+                line = self.stream.readline(limit)
+            yield None
+
+    def __iter__(self):
+        for line in self.lines():
+            try:
+                if line is None:
+                    raise InvalidReport('Line longer than %s bytes'
+                                        % self.max_line_length)
+                line = line.strip()
+                if not line:
+                    continue
+                report = json.loads(line.decode('utf-8'))
+                validate_report(report)
+            except ValueError as e:
+                logger.warning("Discarding report: %s", e)
+                self.rejected += 1
+                continue
+            yield report
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def text(value):
+    return value if value is None else str(value)
+
+
+def normalize_report(report, meta):
+    validate_report(report)
+    host = str(report.get('host') or meta.get('REMOTE_HOST') or '')
+    if not host:
+        raise InvalidReport('Report without host: %s' % report)
+    if len(host) > NAME_LENGTH:
+        raise InvalidReport('Host longer than %s characters: %s'
+                            % (NAME_LENGTH, host))
+    queued = report.get(QUEUED_KEY)
+    if queued is not None and not isinstance(queued, (int, float)):
+        raise InvalidReport('Invalid %s: %s' % (QUEUED_KEY, report))
+    return dict(
+        host=host,
+        application=str(report['application']),
+        version=str(report['version']),
+        deployment=text(report.get('deployment', "default")),
+        arguments=report.get('arguments'),
+        # None when saved as soon as it is received
+        reported=(None if queued is None
+                  else datetime.fromtimestamp(queued, timezone.utc)),
+    )
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def new_dimension(model, name):
+    """An unsaved row of `model`, ready for bulk_create."""
+    instance = model(name=name)
+    if model is models.Version:
+        # bulk_create does not call save(), which sets the version key
+        instance.set_key()
+    return instance
+
+
+def resolve_names(model, names):
+    """Maps every name to a primary key, creating the missing rows."""
+    found = {}
+    for name in names:
+        pk = dimensions.cache.get((model, name))
+        if pk is not None:
+            found[name] = pk
+    pending = [name for name in names if name not in found]
+    for chunk in chunks(pending):
+        for name, pk in (model.objects.filter(name__in=chunk)
+                         .order_by('-pk').values_list('name', 'pk')):
+            found[name] = pk
+    missing = [name for name in pending if name not in found]
+    if missing:
+        model.objects.bulk_create([new_dimension(model, name)
+                                   for name in missing])
+        for chunk in chunks(missing):
+            found.update(
+                model.objects.filter(name__in=chunk).values_list('name', 'pk'))
+    if dimensions.enabled():
+        for name in pending:
+            dimensions.cache.set((model, name), found[name])
+    return found
+
+
+def resolve_components(pairs):
+    """Maps (version_id, application_id) pairs to component ids."""
+    found = {}
+    for pair in pairs:
+        pk = dimensions.cache.get((models.Component, pair))
+        if pk is not None:
+            found[pair] = pk
+    pending = [pair for pair in pairs if pair not in found]
+    version_ids = set(version for version, _ in pending)
+    application_ids = set(application for _, application in pending)
+    for chunk in chunks(application_ids):
+        rows = (models.Component.objects
+                .filter(application_id__in=chunk, version_id__in=version_ids)
+                .order_by('-pk')
+                .values_list('version_id', 'application_id', 'pk'))
+        for version, application, pk in rows:
+            if (version, application) in pairs:
+                found[(version, application)] = pk
+    missing = [pair for pair in pending if pair not in found]
+    if missing:
+        models.Component.objects.bulk_create([
+            models.Component(version_id=version, application_id=application)
+            for version, application in missing
+        ])
+        found.update(resolve_components(set(missing)))
+    if dimensions.enabled():
+        for pair in pending:
+            dimensions.cache.set((models.Component, pair), found[pair])
+    return found
+
+
+def bulk_update(model, values, fields, **extra):
+    """Updates many rows with one statement per chunk.
+
+    `values` maps primary keys to dicts with the new value of every field;
+    `extra` holds values shared by all of them.
+    """
+    for chunk in chunks(values):
+        changes = dict(
+            (field, Case(*[When(pk=pk, then=Value(
+                values[pk][field], output_field=model._meta.get_field(field)))
+                for pk in chunk], output_field=model._meta.get_field(field)))
+            for field in fields
+        )
+        changes.update(extra)
+        model.objects.filter(pk__in=chunk).update(**changes)
+
+
+def fingerprint_key(row):
+    return 'fingerprint:%s' % json.dumps([row['host'], row['deployment']])
+
+
+def fingerprint(row):
+    data = json.dumps([row['application'], row['version'], row['arguments']])
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def skip_unchanged(rows):
+    """Touches the services whose report matches the stored fingerprint.
+
+    Returns the rows that still have to be written.
+    """
+    stored = store.get_many(fingerprint_key(row) for row in rows)
+    unchanged, pending = {}, []
+    for row, value in zip(rows, stored):
+        digest, _, pk = (value or '').partition(' ')
+        if digest == fingerprint(row):
+            unchanged[int(pk)] = row
+        else:
+            pending.append(row)
+    if not unchanged:
+        return pending
+
+    now = timezone.now()
+    touched = touch(dict((pk, row['reported'] or now)
+                         for pk, row in unchanged.items()))
+    if touched < len(unchanged):
+        # Some services were removed since their fingerprint was stored
+        existing = set()
+        for chunk in chunks(unchanged):
+            existing.update(models.Service.objects.filter(pk__in=chunk)
+                            .values_list('pk', flat=True))
+        pending.extend(row for pk, row in unchanged.items()
+                       if pk not in existing)
+    return pending
+
+
+def touch(times):
+    """Moves `updated` of the services forward to the time given by pk.
+
+    Returns how many of them exist. A newer `updated` alone leaves the
+    generation alone, so heartbeats keep ETags and cached responses valid.
+    Clearing the stale flag bumps it.
+    """
+    field = models.Service._meta.get_field('updated')
+    touched = revived = 0
+    for chunk in chunks(times):
+        updated = Greatest('updated', Case(
+            *[When(pk=pk, then=Value(times[pk], output_field=field))
+              for pk in chunk], output_field=field))
+        revived += models.Service.objects.filter(
+            pk__in=chunk, stale=True).update(updated=updated, stale=False)
+        touched += models.Service.objects.filter(pk__in=chunk).update(
+            updated=updated)
+    if revived:
+        generation.bump()
+    return touched
+
+
+def remember_fingerprints(rows, services):
+    store.set_many(
+        dict((fingerprint_key(row),
+              '%s %s' % (fingerprint(row),
+                         services[row['host'], row['deployment']]))
+             for row in rows),
+        settings.VERSION_FINGERPRINT_TTL,
+    )
+
+
+def save_reports(reports, meta):
+    # The last report for a given host and deployment wins, unless it was
+    # queued before the other.
+    rows = {}
+    for report in reports:
+        try:
+            row = normalize_report(report, meta)
+        except (KeyError, InvalidReport):
+            logger.warning("Discarding invalid report %s", report)
+            continue
+        key = (row['host'], row['deployment'])
+        previous = rows.get(key)
+        if (previous is None or row['reported'] is None or
+                previous['reported'] is None or
+                row['reported'] >= previous['reported']):
+            rows[key] = row
+    if not rows:
+        return
+
+    rows = list(rows.values())
+    for attempt in range(INTEGRITY_RETRIES):
+        dimensions.validate()
+        try:
+            with transaction.atomic():
+                with metrics.stage('fingerprint'):
+                    pending = skip_unchanged(rows)
+                if pending:
+                    write_rows(pending)
+            return
+        except IntegrityError:
+            if attempt == INTEGRITY_RETRIES - 1:
+                raise
+            dimensions.cache.clear()
+            logger.info("Conflict saving reports, retrying", exc_info=True)
+
+
+def save_report(report, meta):
+    """Saves one report and returns the version it replaced, if any."""
+    row = normalize_report(report, meta)
+    for attempt in range(INTEGRITY_RETRIES):
+        try:
+            return write_report(row)
+        except IntegrityError:
+            if attempt == INTEGRITY_RETRIES - 1:
+                raise
+            logger.info("Conflict saving report, retrying", exc_info=True)
+
+
+def write_report(row):
+    with transaction.atomic():
+        with metrics.stage('fingerprint'):
+            if not skip_unchanged([row]):
+                return row['version']
+        with metrics.stage('upsert'):
+            service, replaced, previous, changed = upsert.upsert_service(row)
+        if changed:
+            generation.bump()
+        with metrics.stage('matrix'):
+            host, deployment, component = models.Service.objects.values_list(
+                'host_id', 'deployment_id', 'component_id').get(pk=service)
+            if replaced != component:
+                update_matrix([(dict(host_id=host, deployment_id=deployment,
+                                     component_id=component), replaced)])
+        transaction.on_commit(lambda: remember_fingerprints(
+            [row], {(row['host'], row['deployment']): service}))
+    return previous
+
+
+def write_rows(rows):
+    with metrics.stage('host'):
+        hosts = resolve_names(
+            models.Host, set(row['host'] for row in rows))
+    with metrics.stage('application'):
+        applications = resolve_names(
+            models.Application, set(row['application'] for row in rows))
+    with metrics.stage('version'):
+        versions = resolve_names(
+            models.Version, set(row['version'] for row in rows))
+    with metrics.stage('deployment'):
+        deployments = resolve_names(
+            models.Deployment, set(row['deployment'] for row in rows))
+    with metrics.stage('component'):
+        components = resolve_components(set(
+            (versions[row['version']], applications[row['application']])
+            for row in rows
+        ))
+    with metrics.stage('service'):
+        services, moved = save_services([
+            dict(
+                host_id=hosts[row['host']],
+                deployment_id=deployments[row['deployment']],
+                component_id=components[(versions[row['version']],
+                                         applications[row['application']])],
+                arguments=row['arguments'],
+                reported=row['reported'],
+            )
+            for row in rows
+        ])
+    with metrics.stage('history'):
+        record_changes(moved)
+    with metrics.stage('matrix'):
+        update_matrix(moved)
+    # Outdated rows were not written and leave the fingerprints alone
+    saved = [row for row in rows
+             if (hosts[row['host']], deployments[row['deployment']])
+             in services]
+    transaction.on_commit(lambda: remember_fingerprints(saved, dict(
+        ((row['host'], row['deployment']),
+         services[hosts[row['host']], deployments[row['deployment']]])
+        for row in saved
+    )))
+
+
+def queue_reports(reports, meta):
+    """Leaves the reports in redis for the next `drain_reports` batch."""
+    if 'REMOTE_HOST' in meta:
+        reports = [dict(report, host=report.get('host') or meta['REMOTE_HOST'])
+                   for report in reports]
+    # Tells drained reports older than the service apart
+    now = time.time()
+    reports = [dict(report, **{QUEUED_KEY: now}) for report in reports]
+    return store.push(QUEUE, [json.dumps(report) for report in reports])
+
+
+def drain_reports(size, wait):
+    """Saves up to `size` queued reports, waiting up to `wait` seconds.
+
+    One drain runs at a time. Reports are moved to PROCESSING_QUEUE and only
+    removed from redis once they are saved, so a drain takes first the ones
+    left there by a drain that crashed or could not save them. Returns how
+    many reports were handled, 0 while the database is not available.
+    """
+    if not store.claim_many([DRAIN_LOCK],
+                            settings.VERSION_INGEST_DRAIN_TIMEOUT)[0]:
+        return 0
+    values = store.peek(PROCESSING_QUEUE)
+    values.extend(store.take(QUEUE, PROCESSING_QUEUE, size - len(values)))
+    deadline = time.time() + wait
+    while len(values) < size and time.time() < deadline:
+        time.sleep(min(POLL_INTERVAL, max(deadline - time.time(), 0)))
+        values.extend(store.take(QUEUE, PROCESSING_QUEUE,
+                                 size - len(values)))
+    if not save_queued(values):
+        # The lock is kept until the retry delay expires
+        return 0
+    store.delete_many([DRAIN_LOCK])
+    return len(values)
+
+
+def save_queued(values):
+    """Saves the queued `values`, oldest first, and forgets them.
+
+    Returns False if the database was not available.
+    """
+    reports = []
+    for value in values:
+        try:
+            reports.append((value, json.loads(value)))
+        except ValueError:
+            logger.warning("Discarding malformed queued report %s", value)
+    try:
+        save_reports([report for _, report in reports], {})
+    except UNAVAILABLE:
+        return back_off()
+    except Exception:
+        logger.exception("Could not save a batch of reports, "
+                         "saving them one by one")
+        return retry_reports(reports)
+    store.delete_many([PROCESSING_QUEUE])
+    return True
+
+
+def retry_reports(reports):
+    """Saves every (value, report) pair on its own.
+
+    The reports that fail stay in PROCESSING_QUEUE, ahead of newer ones,
+    until they fail MAX_ATTEMPTS times and are moved to FAILED_QUEUE.
+    Errors of the database connection are not the fault of any report:
+    the remaining reports are left for the next drain without counting.
+    """
+    kept, failed, available = [], [], True
+    for i, (value, report) in enumerate(reports):
+        try:
+            save_reports([report], {})
+        except UNAVAILABLE:
+            kept.extend(value for value, _ in reports[i:])
+            available = back_off()
+            break
+        except Exception:
+            logger.exception("Could not save queued report %s", report)
+            if (store.increment(ATTEMPTS, value) or 0) < MAX_ATTEMPTS:
+                kept.append(value)
+            else:
+                failed.append(value)
+    if failed:
+        metrics.DROPPED_REPORTS.inc(len(failed))
+        store.push(FAILED_QUEUE, failed)
+        store.delete_fields(ATTEMPTS, failed)
+    store.replace(PROCESSING_QUEUE, kept)
+    return available
+
+
+def back_off():
+    """Holds the drain lock for VERSION_INGEST_RETRY_DELAY seconds."""
+    delay = settings.VERSION_INGEST_RETRY_DELAY
+    logger.warning("The database is not available, retrying queued "
+                   "reports in %s seconds", delay, exc_info=True)
+    store.set_many({DRAIN_LOCK: 1}, delay)
+    return False
+
+
+def requeue_failed(count=BATCH_SIZE):
+    """Moves the reports of FAILED_QUEUE back to the queue.
+
+    Returns how many were moved.
+    """
+    moved = 0
+    while True:
+        taken = len(store.take(FAILED_QUEUE, QUEUE, count))
+        moved += taken
+        if taken < count:
+            return moved
+
+
+def save_services(rows):
+    """Writes the services.
+
+    `updated` becomes the time the row was queued, or now. Rows queued
+    before the last update of their service are outdated and skipped.
+    Returns the ids of the services written by (host, deployment), and the
+    rows whose component changed along with the previous component, None
+    for new services.
+    """
+    wanted = dict(((row['host_id'], row['deployment_id']), row)
+                  for row in rows)
+    existing = {}
+    for chunk in chunks(set(row['host_id'] for row in rows)):
+        services = (models.Service.objects
+                    .filter(host_id__in=chunk)
+                    .values('pk', 'host_id', 'deployment_id',
+                            'component_id', 'arguments', 'updated'))
+        for service in services:
+            key = (service['host_id'], service['deployment_id'])
+            if key in wanted:
+                existing[key] = service
+
+    now = timezone.now()
+    created, changed, unchanged, moved, queued = [], {}, {}, [], {}
+    for key, row in wanted.items():
+        service = existing.get(key)
+        updated = row['reported'] or now
+        if service is None:
+            created.append(models.Service(
+                host_id=row['host_id'], deployment_id=row['deployment_id'],
+                component_id=row['component_id'],
+                arguments=row['arguments']))
+            moved.append((row, None))
+            if row['reported']:
+                queued[key] = row['reported']
+        elif service['updated'] > updated:
+            del existing[key]
+        elif (service['component_id'] != row['component_id'] or
+              service['arguments'] != row['arguments']):
+            changed[service['pk']] = dict(row, updated=updated)
+            if service['component_id'] != row['component_id']:
+                moved.append((row, service['component_id']))
+        else:
+            unchanged[service['pk']] = updated
+
+    models.Service.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    bulk_update(models.Service, changed,
+                ('component_id', 'arguments', 'updated'), stale=False)
+    if created or changed:
+        generation.bump()
+    touch(unchanged)
+
+    services = dict((key, service['pk']) for key, service in existing.items())
+    for chunk in chunks(set(service.host_id for service in created)):
+        found = (models.Service.objects
+                 .filter(host_id__in=chunk)
+                 .values_list('host_id', 'deployment_id', 'pk'))
+        for host, deployment, pk in found:
+            services.setdefault((host, deployment), pk)
+    # bulk_create sets the auto_now `updated` to now
+    bulk_update(models.Service, dict((services[key], {'updated': updated})
+                                     for key, updated in queued.items()),
+                ('updated', ))
+    return services, moved
+
+
+def record_changes(moved):
+    """Appends a VersionChange for every (row, previous component) pair."""
+    if not moved:
+        return
+    component_ids = set(row['component_id'] for row, _ in moved)
+    component_ids.update(previous for _, previous in moved if previous)
+    components = {}
+    for chunk in chunks(component_ids):
+        for pk, application, version in (
+                models.Component.objects.filter(pk__in=chunk)
+                .values_list('pk', 'application_id', 'version_id')):
+            components[pk] = (application, version)
+    models.VersionChange.objects.bulk_create([
+        models.VersionChange(
+            host_id=row['host_id'],
+            deployment_id=row['deployment_id'],
+            application_id=components[row['component_id']][0],
+            version_id=components[row['component_id']][1],
+            previous_id=previous and components[previous][1],
+        )
+        for row, previous in moved
+    ], batch_size=BATCH_SIZE)
+
+
+def update_matrix(moved):
+    """Moves the services in the matrix from their previous component."""
+    changes = []
+    for row, previous in moved:
+        changes.append(
+            ((row['host_id'], row['deployment_id'], row['component_id']), 1))
+        if previous:
+            changes.append(
+                ((row['host_id'], row['deployment_id'], previous), -1))
+    matrix.add_services(changes)
+
+
+def service_fingerprint_keys(pk):
+    """Fingerprint keys of the stored host and deployment of service `pk`.
+    """
+    if store.get_client() is None:
+        return []
+    return [fingerprint_key(dict(host=host, deployment=deployment))
+            for host, deployment in models.Service.objects.filter(pk=pk)
+            .values_list('host__name', 'deployment__name')]
+
+
+def forget_fingerprints(keys):
+    transaction.on_commit(lambda: store.delete_many(keys))
+
+
+def remember_fingerprint_keys(sender, instance, raw=False, **kwargs):
+    instance._fingerprint_keys = []
+    if instance.pk and not raw:
+        instance._fingerprint_keys = service_fingerprint_keys(instance.pk)
+
+
+def service_edited(sender, instance, raw=False, **kwargs):
+    """Makes the next report of a service edited by hand write it again.
+
+    Ingestion writes in bulk and sends no signals, so this only runs for
+    the API, the admin and other model writes.
+    """
+    if not raw:
+        forget_fingerprints(getattr(instance, '_fingerprint_keys', []) +
+                            service_fingerprint_keys(instance.pk))
+
+
+def service_removed(sender, instance, **kwargs):
+    forget_fingerprints(service_fingerprint_keys(instance.pk))
+
+
+pre_save.connect(remember_fingerprint_keys, sender=models.Service,
+                 dispatch_uid='fingerprint-service-pre-save')
+post_save.connect(service_edited, sender=models.Service,
+                  dispatch_uid='fingerprint-service-save')
+pre_delete.connect(service_removed, sender=models.Service,
+                   dispatch_uid='fingerprint-service-delete')
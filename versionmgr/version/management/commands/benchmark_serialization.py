@@ -0,0 +1,59 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from version import ingest, views, fastpath, serializers
+
+
+class Command(BaseCommand):
+    help = ('Measures rows/sec of the service list with the serializers and '
+            'with the fast path, on throwaway services')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        count = options['services']
+        with transaction.atomic():
+            ingest.save_reports([
+                {'host': 'benchmark%s' % (i // 10),
+                 'deployment': 'deployment%s' % (i % 10),
+                 'application': 'application%s' % (i % 50),
+                 'version': '1.%s' % (i % 20)}
+                for i in range(count)
+            ], {})
+            request = Request(APIRequestFactory().get('/api/service/'))
+            request.user = User(is_superuser=True)
+            view = views.ServiceViewSet(request=request, format_kwarg=None)
+            queryset = view.get_queryset().filter(
+                host__name__startswith='benchmark')
+
+            def serializer():
+                data = serializers.ServiceWithDepsSerializer(
+                    queryset, many=True, context={'request': request}).data
+                return JSONRenderer().render(data)
+
+            def fast():
+                rows = list(queryset.select_related(None)
+                            .prefetch_related(None)
+                            .values(*fastpath.SERVICE_COLUMNS))
+                return fastpath.dumps(fastpath.service_rows(rows, request))
+
+            for name, function in (('serializer', serializer),
+                                   ('fast path', fast)):
+                best = min(self.measure(function)
+                           for _ in range(options['repeat']))
+                self.stdout.write('%-10s %10.0f rows/sec' % (
+                    name, count / best))
+            transaction.set_rollback(True)
+
+    def measure(self, function):
+        start = time.time()
+        function()
+        return time.time() - start
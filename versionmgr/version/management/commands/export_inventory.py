@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from version import export
+
+
+class Command(BaseCommand):
+    help = 'Writes every service of the inventory as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(export.FORMATS),
+                            default='ndjson')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        for line in export.lines(options['format'], options['chunk_size']):
+            self.stdout.write(line, ending='')
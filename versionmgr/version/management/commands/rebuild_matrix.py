@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from version import matrix
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the version matrix, after writes that sent no "
+            "signals such as queryset updates")
+
+    def handle(self, *args, **options):
+        self.stdout.write('%s matrix rows' % matrix.rebuild())
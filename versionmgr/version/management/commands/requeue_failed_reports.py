@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from version import ingest
+
+
+class Command(BaseCommand):
+    help = ('Moves the queued reports that kept failing back to the '
+            'ingestion queue')
+
+    def handle(self, *args, **options):
+        moved = ingest.requeue_failed()
+        self.stdout.write('%s reports queued again' % moved)
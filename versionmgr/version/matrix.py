@@ -0,0 +1,284 @@
+"""Incremental maintenance of the VersionCount matrix.
+
+Every write that moves services between cells, each an (application,
+cluster, deployment) triple, adds or removes them from the counts of the
+rows involved, so reading the matrix never needs the joins across services,
+components and hosts. Ingestion calls `add_services` for the rows it writes
+in bulk; signals cover the writes made through the models.
+
+Counts change with F() updates, which lock only the rows they change, in id
+order so that two transactions cannot deadlock. Rows reaching zero are
+deleted. A missing row is created while holding the row of its application,
+as the unique constraint does not cover a NULL cluster or deployment, so the
+transaction that waited updates the row the other one created.
+
+Queryset updates and raw SQL send no signals: after changing the cluster of
+hosts, the version or application of components, or the host, deployment or
+component of services that way, run the rebuild_matrix command.
+"""
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from version import models
+
+# Three variables per cell keep the queries below SQLite's limit.
+CHUNK_SIZE = 100
+
+COLUMNS = ('application_id', 'cluster_id', 'deployment_id', 'version_id')
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def equal(lookups):
+    """Filter arguments for the (lookup, value) pairs, NULL included."""
+    return dict((lookup + '__isnull', True) if value is None
+                else (lookup, value) for lookup, value in lookups)
+
+
+def cells(services):
+    """Cells of the (host_id, deployment_id, component_id) triples."""
+    services = set(services)
+    clusters, applications = {}, {}
+    for chunk in chunks(set(host for host, _, _ in services)):
+        clusters.update(models.Host.objects.filter(pk__in=chunk)
+                        .values_list('pk', 'cluster_id'))
+    for chunk in chunks(set(component for _, _, component in services)):
+        applications.update(models.Component.objects.filter(pk__in=chunk)
+                            .values_list('pk', 'application_id'))
+    return set(
+        (applications[component], clusters[host], deployment)
+        for host, deployment, component in services
+        if host in clusters and component in applications
+    )
+
+
+def cell_filter(cells, application, cluster, deployment):
+    """Q matching the rows of `cells`, given the lookup of every column."""
+    return reduce(or_, (
+        Q(**equal(zip((application, cluster, deployment), cell)))
+        for cell in cells
+    ))
+
+
+def lock(cells):
+    """Waits for the other transactions creating or refreshing rows of the
+    applications of `cells`, in id order so that they cannot deadlock."""
+    applications = sorted(set(cell[0] for cell in cells))
+    for chunk in chunks(applications):
+        list(models.Application.objects.select_for_update()
+             .filter(pk__in=chunk).order_by('pk').values_list('pk'))
+
+
+def deltas(changes):
+    """Counter of matrix rows, keyed by COLUMNS, for the
+    ((host_id, deployment_id, component_id), services) pairs."""
+    changes = list(changes)
+    clusters, components = {}, {}
+    for chunk in chunks(set(host for (host, _, _), _ in changes)):
+        clusters.update(models.Host.objects.filter(pk__in=chunk)
+                        .values_list('pk', 'cluster_id'))
+    for chunk in chunks(set(component for (_, _, component), _ in changes)):
+        components.update(
+            (pk, (application, version)) for pk, application, version
+            in models.Component.objects.filter(pk__in=chunk)
+            .values_list('pk', 'application_id', 'version_id'))
+    found = Counter()
+    for (host, deployment, component), services in changes:
+        if host in clusters and component in components:
+            application, version = components[component]
+            found[application, clusters[host], deployment, version] += services
+    return found
+
+
+def find(keys):
+    """Ids of the matrix rows of `keys`, keyed by COLUMNS."""
+    keys, found = set(keys), {}
+    for chunk in chunks(set(key[:3] for key in keys)):
+        for row in (models.VersionCount.objects
+                    .filter(cell_filter(chunk, 'application_id', 'cluster_id',
+                                        'deployment_id'))
+                    .values_list('pk', *COLUMNS)):
+            if row[1:] in keys:
+                found[row[1:]] = row[0]
+    return found
+
+
+@transaction.atomic(savepoint=False)
+def apply(deltas):
+    """Adds the services of `deltas`, keyed by COLUMNS, to the matrix."""
+    deltas = dict((key, services) for key, services in deltas.items()
+                  if services)
+    rows = find(deltas)
+    missing = [key for key, services in deltas.items()
+               if services > 0 and key not in rows]
+    if missing:
+        lock(missing)
+        rows.update(find(missing))
+    keys = dict((pk, key) for key, pk in rows.items())
+    removed = {}
+    for chunk in chunks(sorted(keys)):
+        locked = list(models.VersionCount.objects.select_for_update()
+                      .filter(pk__in=chunk).order_by('pk')
+                      .values_list('pk', flat=True))
+        for pk in set(chunk) - set(locked):
+            if deltas[keys[pk]] > 0:
+                removed[keys[pk]] = deltas[keys[pk]]
+        if not locked:
+            continue
+        change = Case(*[When(pk=pk, then=Value(deltas[keys[pk]]))
+                        for pk in locked], output_field=IntegerField())
+        models.VersionCount.objects.filter(pk__in=locked).update(
+            services=Greatest(F('services') + change, Value(0),
+                              output_field=IntegerField()))
+        models.VersionCount.objects.filter(pk__in=locked, services=0).delete()
+    models.VersionCount.objects.bulk_create([
+        models.VersionCount(services=deltas[key], **dict(zip(COLUMNS, key)))
+        for key in missing if key not in rows
+    ])
+    if removed:
+        # Rows emptied by another transaction since they were looked up
+        apply(removed)
+
+
+def add_services(changes):
+    """Adds the ((host_id, deployment_id, component_id), services) pairs to
+    the matrix, removing them for negative counts."""
+    found = deltas(changes)
+    if found:
+        apply(found)
+
+
+def counts(services):
+    """Matrix rows counting the `services` queryset."""
+    return [
+        models.VersionCount(application_id=application, cluster_id=cluster,
+                            deployment_id=deployment, version_id=version,
+                            services=count)
+        for application, cluster, deployment, version, count in services
+        .values_list('component__application_id', 'host__cluster_id',
+                     'deployment_id', 'component__version_id')
+        .annotate(count=Count('id')).order_by()
+    ]
+
+
+@transaction.atomic(savepoint=False)
+def refresh(cells):
+    """Recomputes the counts of the given cells."""
+    lock(cells)
+    for chunk in chunks(cells):
+        models.VersionCount.objects.filter(cell_filter(
+            chunk, 'application_id', 'cluster_id', 'deployment_id')).delete()
+        models.VersionCount.objects.bulk_create(counts(
+            models.Service.objects.filter(cell_filter(
+                chunk, 'component__application_id', 'host__cluster_id',
+                'deployment_id'))))
+
+
+@transaction.atomic(savepoint=False)
+def rebuild():
+    """Recomputes the whole matrix. Returns the number of rows."""
+    list(models.Application.objects.select_for_update().order_by('pk')
+         .values_list('pk'))
+    models.VersionCount.objects.all().delete()
+    rows = counts(models.Service.objects.all())
+    models.VersionCount.objects.bulk_create(rows, batch_size=CHUNK_SIZE)
+    return len(rows)
+
+
+def service_key(service):
+    return (service.host_id, service.deployment_id, service.component_id)
+
+
+def remember_service(sender, instance, raw=False, **kwargs):
+    instance._matrix_previous = None
+    if instance.pk and not raw:
+        instance._matrix_previous = (
+            models.Service.objects.filter(pk=instance.pk)
+            .values_list('host_id', 'deployment_id', 'component_id').first())
+
+
+def service_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_matrix_previous', None)
+    if previous != service_key(instance):
+        add_services([(service_key(instance), 1)] + ([(previous, -1)]
+                                                     if previous else []))
+
+
+def service_deleted(sender, instance, **kwargs):
+    add_services([(service_key(instance), -1)])
+
+
+def remember_cluster(sender, instance, raw=False, **kwargs):
+    instance._matrix_cluster = instance.cluster_id
+    if instance.pk and not raw:
+        instance._matrix_cluster = (
+            models.Host.objects.filter(pk=instance.pk)
+            .values_list('cluster_id', flat=True).first())
+
+
+def host_saved(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_matrix_cluster', instance.cluster_id)
+    if raw or created or previous == instance.cluster_id:
+        return
+    found = Counter()
+    for application, deployment, version, services in (
+            models.Service.objects.filter(host=instance)
+            .values_list('component__application_id', 'deployment_id',
+                         'component__version_id')
+            .annotate(services=Count('id')).order_by()):
+        found[application, previous, deployment, version] -= services
+        found[application, instance.cluster_id, deployment,
+              version] += services
+    apply(found)
+
+
+def remember_component(sender, instance, raw=False, **kwargs):
+    instance._matrix_component = None
+    if instance.pk and not raw:
+        instance._matrix_component = (
+            models.Component.objects.filter(pk=instance.pk)
+            .values_list('application_id', 'version_id').first())
+
+
+def component_saved(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_matrix_component', None)
+    current = (instance.application_id, instance.version_id)
+    if raw or created or previous in (None, current):
+        return
+    found = Counter()
+    for cluster, deployment, services in (
+            models.Service.objects.filter(component=instance)
+            .values_list('host__cluster_id', 'deployment_id')
+            .annotate(services=Count('id')).order_by()):
+        found[previous[0], cluster, deployment, previous[1]] -= services
+        found[instance.application_id, cluster, deployment,
+              instance.version_id] += services
+    apply(found)
+
+
+pre_save.connect(remember_service, sender=models.Service,
+                 dispatch_uid='matrix-service-pre-save')
+post_save.connect(service_saved, sender=models.Service,
+                  dispatch_uid='matrix-service-save')
+post_delete.connect(service_deleted, sender=models.Service,
+                    dispatch_uid='matrix-service-delete')
+pre_save.connect(remember_cluster, sender=models.Host,
+                 dispatch_uid='matrix-host-pre-save')
+post_save.connect(host_saved, sender=models.Host,
+                  dispatch_uid='matrix-host-save')
+pre_save.connect(remember_component, sender=models.Component,
+                 dispatch_uid='matrix-component-pre-save')
+post_save.connect(component_saved, sender=models.Component,
+                  dispatch_uid='matrix-component-save')
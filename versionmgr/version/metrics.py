@@ -0,0 +1,133 @@
+"""Prometheus metrics of the ingestion pipeline and the API.
+
+When the `prometheus_multiproc_dir` environment variable points to a
+directory, every gunicorn and celery process writes its samples there and
+/metrics aggregates all of them.
+"""
+import os
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+from prometheus_client import (
+    Counter, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST,
+    generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from version import store
+
+REQUEST_SECONDS = Histogram(
+    'version_request_seconds',
+    'Time spent answering requests, by view.',
+    ['view', 'method'],
+)
+TASK_SECONDS = Histogram(
+    'version_task_seconds',
+    'Time spent running ingestion tasks.',
+    ['task'],
+)
+TASK_FAILURES = Counter(
+    'version_task_failures_total',
+    'Ingestion tasks that raised, by the stage they were in.',
+    ['task', 'stage'],
+)
+DROPPED_REPORTS = Counter(
+    'version_dropped_reports_total',
+    'Queued reports moved to the failed list after repeated errors.',
+)
+STAGE_SECONDS = Histogram(
+    'version_ingest_stage_seconds',
+    'Time spent in every stage of the ingestion.',
+    ['stage'],
+)
+
+_current = threading.local()
+
+
+@contextmanager
+def stage(name):
+    previous = getattr(_current, 'stage', None)
+    _current.stage = name
+    start = time.time()
+    try:
+        yield
+        # On errors the stage is kept, so `tracked` knows where it failed
+        _current.stage = previous
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.time() - start)
+
+
+def tracked(name):
+    """Measures a task, counting its failures by ingestion stage."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            _current.stage = None
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                TASK_FAILURES.labels(name, _current.stage or 'task').inc()
+                raise
+            finally:
+                TASK_SECONDS.labels(name).observe(time.time() - start)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        request._metrics_start = time.time()
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        match = getattr(request, 'resolver_match', None)
+        if start is not None and match is not None:
+            REQUEST_SECONDS.labels(match.view_name, request.method).observe(
+                time.time() - start)
+        return response
+
+
+class QueueCollector(object):
+    """Reads the length of the ingestion queues on every scrape."""
+    def collect(self):
+        gauge = GaugeMetricFamily(
+            'version_queue_length',
+            'Messages waiting to be ingested.',
+            labels=['queue'],
+        )
+        queues = (
+            ('celery', settings.CELERY_BROKER_URL, 'celery'),
+            ('reports', settings.VERSION_REDIS_URL, store.PREFIX + 'reports'),
+            ('reports_failed', settings.VERSION_REDIS_URL,
+             store.PREFIX + 'reports:failed'),
+        )
+        for name, url, key in queues:
+            client = store.get_client(url)
+            if client is None:
+                continue
+            try:
+                gauge.add_metric([name], client.llen(key))
+            except redis.RedisError:
+                pass
+        yield gauge
+
+
+# Of the text returned by render()
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def render():
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    queues = CollectorRegistry()
+    queues.register(QueueCollector())
+    return generate_latest(registry) + generate_latest(queues)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:50
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def duplicates(queryset, *fields):
+    """Yields the oldest row and its duplicates for every repeated key."""
+    groups = (queryset.values(*fields)
+              .annotate(count=Count('pk'), keeper=Min('pk'))
+              .filter(count__gt=1))
+    for group in groups:
+        rows = queryset.filter(**dict((f, group[f]) for f in fields))
+        yield group['keeper'], list(rows.exclude(pk=group['keeper'])
+                                    .values_list('pk', flat=True))
+
+
+def move_attributes(apps, model_name, keeper, pks):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Attribute = apps.get_model('version', 'Attribute')
+    content_type = ContentType.objects.filter(
+        app_label='version', model=model_name).first()
+    if content_type is not None:
+        Attribute.objects.filter(
+            content_type=content_type, object_id__in=pks,
+        ).update(object_id=keeper)
+
+
+def move_m2m(through, field, keeper, pks, other):
+    """Points `field` of the through rows to `keeper`, dropping repeated pairs.
+    """
+    existing = set(through.objects.filter(**{field: keeper})
+                   .values_list(other, flat=True))
+    for row in through.objects.filter(**{field + '__in': pks}):
+        value = getattr(row, other)
+        if value in existing:
+            row.delete()
+        else:
+            existing.add(value)
+            setattr(row, field, keeper)
+            row.save()
+
+
+def merge_duplicates(apps, schema_editor):
+    Version = apps.get_model('version', 'Version')
+    Application = apps.get_model('version', 'Application')
+    Deployment = apps.get_model('version', 'Deployment')
+    Host = apps.get_model('version', 'Host')
+    Component = apps.get_model('version', 'Component')
+    Service = apps.get_model('version', 'Service')
+    Customer = apps.get_model('version', 'Customer')
+    Release = apps.get_model('version', 'Release')
+
+    for keeper, pks in duplicates(Version.objects.exclude(name=None), 'name'):
+        Component.objects.filter(version_id__in=pks).update(version_id=keeper)
+        Version.objects.filter(pk__in=pks).delete()
+
+    for keeper, pks in duplicates(Application.objects.all(), 'name'):
+        Component.objects.filter(application_id__in=pks).update(
+            application_id=keeper)
+        move_attributes(apps, 'application', keeper, pks)
+        Application.objects.filter(pk__in=pks).delete()
+
+    for keeper, pks in duplicates(Deployment.objects.all(), 'name'):
+        Service.objects.filter(deployment_id__in=pks).update(
+            deployment_id=keeper)
+        move_m2m(Customer.deployments.through, 'deployment_id', keeper, pks,
+                 'customer_id')
+        Deployment.objects.filter(pk__in=pks).delete()
+
+    for keeper, pks in duplicates(Component.objects.all(),
+                                  'version', 'application'):
+        Service.objects.filter(component_id__in=pks).update(
+            component_id=keeper)
+        Component.objects.filter(pk__in=pks).delete()
+
+    for keeper, pks in duplicates(Host.objects.all(), 'name'):
+        Service.objects.filter(host_id__in=pks).update(host_id=keeper)
+        move_attributes(apps, 'host', keeper, pks)
+        Host.objects.filter(pk__in=pks).delete()
+
+    # The service reported last is the one that describes the host
+    for oldest, pks in duplicates(Service.objects.all(), 'host', 'deployment'):
+        pks.append(oldest)
+        keeper = (Service.objects.filter(pk__in=pks)
+                  .order_by('-updated', '-pk').first().pk)
+        pks.remove(keeper)
+        move_m2m(Release.services.through, 'service_id', keeper, pks,
+                 'release_id')
+        Service.objects.filter(pk__in=pks).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('version', '0018_auto_20161102_0615'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
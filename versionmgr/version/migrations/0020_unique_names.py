@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0019_merge_duplicate_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='application',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='deployment',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='host',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='version',
+            name='name',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='component',
+            unique_together=set([('version', 'application')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='service',
+            unique_together=set([('host', 'deployment')]),
+        ),
+    ]
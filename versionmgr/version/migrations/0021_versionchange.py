@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 19:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0020_unique_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='version.Application')),
+                ('deployment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='version.Deployment')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='version.Host')),
+                ('previous', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='version.Version')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='version.Version')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='versionchange',
+            index_together=set([('application', 'created'), ('host', 'created')]),
+        ),
+    ]
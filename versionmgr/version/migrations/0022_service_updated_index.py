@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0021_versionchange'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='service',
+            index_together=set([('updated', 'id')]),
+        ),
+    ]
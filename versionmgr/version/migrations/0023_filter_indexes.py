@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0022_service_updated_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cluster',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def build_matrix(apps, schema_editor):
+    Service = apps.get_model('version', 'Service')
+    VersionCount = apps.get_model('version', 'VersionCount')
+    counts = (Service.objects
+              .values_list('component__application_id', 'host__cluster_id',
+                           'deployment_id', 'component__version_id')
+              .annotate(services=Count('id'))
+              .order_by())
+    VersionCount.objects.bulk_create([
+        VersionCount(application_id=application, cluster_id=cluster,
+                     deployment_id=deployment, version_id=version,
+                     services=services)
+        for application, cluster, deployment, version, services in counts
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0023_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('services', models.PositiveIntegerField()),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='version.Application')),
+                ('cluster', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='version.Cluster')),
+                ('deployment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='version.Deployment')),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='version.Version')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='versioncount',
+            unique_together=set([('application', 'cluster', 'deployment', 'version')]),
+        ),
+        migrations.RunPython(build_matrix, migrations.RunPython.noop),
+    ]
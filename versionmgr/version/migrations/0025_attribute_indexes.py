@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 21:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models.functions import Substr
+
+
+def fill_value_keys(apps, schema_editor):
+    Attribute = apps.get_model('version', 'Attribute')
+    Attribute.objects.update(value_key=Substr('value', 1, 100))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0024_versioncount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attribute',
+            name='value_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_value_keys, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='attribute',
+            index_together=set([('content_type', 'object_id', 'name'), ('name', 'value_key')]),
+        ),
+    ]
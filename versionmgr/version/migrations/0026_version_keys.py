@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from version import semver
+
+BATCH_SIZE = 500
+
+
+def parse_names(apps, schema_editor):
+    Version = apps.get_model('version', 'Version')
+    last = 0
+    while True:
+        versions = list(Version.objects.filter(pk__gt=last).order_by('pk')
+                        .only('pk', 'name')[:BATCH_SIZE])
+        if not versions:
+            return
+        last = versions[-1].pk
+        for version in versions:
+            for field, value in semver.parse(version.name).items():
+                setattr(version, field, value)
+            version.save(update_fields=semver.FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0025_attribute_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='major',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='minor',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='patch',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='release',
+            field=models.NullBooleanField(editable=False),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='suffix',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(parse_names, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='version',
+            index_together=set([('major', 'minor', 'patch', 'release', 'suffix')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-18 20:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0026_version_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='service',
+            index_together=set([('updated', 'id'), ('stale', 'updated', 'id')]),
+        ),
+    ]
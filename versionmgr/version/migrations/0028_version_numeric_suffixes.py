@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10 on 2026-10-19 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from version import semver
+
+BATCH_SIZE = 500
+
+
+def parse_names(apps, schema_editor):
+    """Parses the names again: suffixes now have zero-padded numbers."""
+    Version = apps.get_model('version', 'Version')
+    last = 0
+    while True:
+        versions = list(Version.objects.filter(pk__gt=last).order_by('pk')
+                        .only('pk', 'name')[:BATCH_SIZE])
+        if not versions:
+            return
+        last = versions[-1].pk
+        for version in versions:
+            for field, value in semver.parse(version.name).items():
+                setattr(version, field, value)
+            version.save(update_fields=semver.FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('version', '0027_service_stale'),
+    ]
+
+    operations = [
+        migrations.RunPython(parse_names, migrations.RunPython.noop),
+    ]
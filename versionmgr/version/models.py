@@ -2,10 +2,17 @@ from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
+from version import semver
+
+# Prefix of the attribute values kept in the indexed `value_key`.
+VALUE_KEY_LENGTH = 100
+
 
 class Attribute(models.Model):
     name = models.CharField(max_length=100)
     value = models.TextField()
+    # Indexable prefix of value, for lookups by name and value
+    value_key = models.CharField(max_length=VALUE_KEY_LENGTH, editable=False)
 
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
@@ -14,20 +21,38 @@ class Attribute(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.value_key = (self.value or '')[:VALUE_KEY_LENGTH]
+        super().save(*args, **kwargs)
+
+    class Meta:
+        index_together = (
+            ('content_type', 'object_id', 'name'),
+            ('name', 'value_key'),
+        )
+
+
+def ordered_attributes(instance):
+    """The attributes of `instance` by name, using them if prefetched."""
+    if 'attributes' in getattr(instance, '_prefetched_objects_cache', {}):
+        return sorted(instance.attributes.all(),
+                      key=lambda attribute: attribute.name)
+    return instance.attributes.order_by('name')
+
 
 class Cluster(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     attributes = GenericRelation(Attribute)
 
     def __str__(self):
         return self.name
 
     def ordered_attributes(self):
-        return self.attributes.order_by('name')
+        return ordered_attributes(self)
 
 
 class Host(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     label = models.CharField(max_length=100, blank=True, null=True)
     cluster = models.ForeignKey(
         Cluster,
@@ -42,7 +67,7 @@ class Host(models.Model):
 
 
 class Deployment(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     label = models.CharField(max_length=100, blank=True, null=True)
 
     def __str__(self):
@@ -50,7 +75,7 @@ class Deployment(models.Model):
 
 
 class Application(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     label = models.CharField(max_length=100, blank=True, null=True)
     description = models.CharField(max_length=200, blank=True, null=True)
     attributes = GenericRelation(Attribute)
@@ -60,15 +85,32 @@ class Application(models.Model):
 
 
 class Version(models.Model):
-    name = models.CharField(max_length=100, blank=True, null=True)
+    name = models.CharField(max_length=100, blank=True, null=True,
+                            unique=True)
+    # Sortable key parsed from the name by version.semver
+    major = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    minor = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    patch = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    release = models.NullBooleanField(editable=False)
+    suffix = models.CharField(max_length=semver.SUFFIX_LENGTH, blank=True,
+                              null=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def set_key(self):
+        for field, value in semver.parse(self.name).items():
+            setattr(self, field, value)
+
+    def save(self, *args, **kwargs):
+        self.set_key()
+        super().save(*args, **kwargs)
+
     class Meta:
         permissions = (
             ('view_version', 'Can see version data'),
         )
+        index_together = (semver.FIELDS, )
 
 
 class Component(models.Model):
@@ -78,6 +120,9 @@ class Component(models.Model):
     def __str__(self):
         return "%s (%s)" % (self.application, self.version)
 
+    class Meta:
+        unique_together = ('version', 'application')
+
 
 class Service(models.Model):
     host = models.ForeignKey(Host, related_name="services")
@@ -87,6 +132,8 @@ class Service(models.Model):
         Deployment, related_name="services", blank=True, null=True)
 
     updated = models.DateTimeField(auto_now=True)
+    # Not reported for VERSION_STALE_HOURS; cleared by the next report
+    stale = models.BooleanField(default=False)
 
     def __str__(self):
         return "%s at %s/%s" % (
@@ -95,9 +142,16 @@ class Service(models.Model):
             self.deployment,
         )
 
+    class Meta:
+        unique_together = ('host', 'deployment')
+        index_together = (
+            ('updated', 'id'),
+            ('stale', 'updated', 'id'),
+        )
+
 
 class Customer(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     deployments = models.ManyToManyField(Deployment, related_name="customers")
     def __str__(self):
         return self.name
@@ -116,3 +170,57 @@ class Release(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class VersionChange(models.Model):
+    """Append-only record of every component change of a service."""
+    host = models.ForeignKey(Host, related_name="changes")
+    deployment = models.ForeignKey(
+        Deployment, related_name="changes", blank=True, null=True)
+    application = models.ForeignKey(Application, related_name="changes")
+    version = models.ForeignKey(Version, related_name="changes")
+    previous = models.ForeignKey(
+        Version, related_name="+", blank=True, null=True,
+        on_delete=models.SET_NULL)
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return "%s %s -> %s at %s" % (
+            self.application,
+            self.previous,
+            self.version,
+            self.host,
+        )
+
+    class Meta:
+        index_together = (
+            ('host', 'created'),
+            ('application', 'created'),
+        )
+
+
+class VersionCount(models.Model):
+    """Services running a version, by application, cluster and deployment.
+
+    Maintained by version.matrix whenever services or hosts change.
+    """
+    application = models.ForeignKey(Application, related_name="+")
+    cluster = models.ForeignKey(
+        Cluster, related_name="+", blank=True, null=True)
+    deployment = models.ForeignKey(
+        Deployment, related_name="+", blank=True, null=True)
+    version = models.ForeignKey(Version, related_name="+")
+    services = models.PositiveIntegerField()
+
+    def __str__(self):
+        return "%s (%s) at %s/%s: %s" % (
+            self.application,
+            self.version,
+            self.cluster,
+            self.deployment,
+            self.services,
+        )
+
+    class Meta:
+        unique_together = ('application', 'cluster', 'deployment', 'version')
@@ -0,0 +1,95 @@
+"""Keyset pagination for the API collections.
+
+Pages are selected with a WHERE on the ordering columns of the last row of
+the previous page instead of an OFFSET, and the total count is never
+computed, so every page costs the same as the first one. The cursor is
+opaque to clients: they follow the `next` links.
+"""
+import json
+import base64
+import binascii
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, values):
+    """Rows after `values` in `ordering`, as in (a, b) > (x, y)."""
+    clauses = []
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = name + ('__lt' if field.startswith('-') else '__gt')
+        clauses.append(Q(**dict(equal, **{lookup: value})))
+        equal[name] = value
+    return reduce(or_, clauses)
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only pagination on unique `ordering` columns.
+
+    Views may override the ordering with a `keyset_ordering` attribute.
+    """
+    ordering = ('id', )
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def encode_cursor(self, instance):
+        get = dict.get if isinstance(instance, dict) else getattr
+        values = [str(get(instance, field.lstrip('-')))
+                  for field in self.ordering]
+        cursor = base64.urlsafe_b64encode(json.dumps(values).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor.decode())
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        self.base_url = request.build_absolute_uri()
+        size = self.get_page_size(request)
+        values = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, values))
+        try:
+            rows = list(queryset[:size + 1])
+        except (ValidationError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        page = rows[:size]
+        self.next = self.encode_cursor(page[-1]) if len(rows) > size else None
+        return page
+
+    def get_paginated_data(self, data):
+        return {'next': self.next, 'results': data}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
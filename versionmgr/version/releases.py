@@ -0,0 +1,47 @@
+"""Release snapshots of the services of a deployment, cluster or customer.
+
+The services are copied into the release with a single INSERT ... SELECT
+into the many to many table, however many there are.
+"""
+from django.db import connection, transaction
+from django.http import Http404
+
+from version import models, generation
+
+# The model of every kind of target, given by name, and its services.
+KINDS = {
+    'deployment': (models.Deployment, 'deployment__name'),
+    'cluster': (models.Cluster, 'host__cluster__name'),
+    'customer': (models.Customer, 'deployment__customers__name'),
+}
+
+
+def snapshot(name, kind, value):
+    """Creates the release `name` with the current services of the target.
+
+    Returns the release and how many services it got. Raises Http404 when
+    there is no such target.
+    """
+    model, lookup = KINDS[kind]
+    if not model.objects.filter(name=value).exists():
+        raise Http404('No %s %s' % (kind, value))
+    services = (models.Service.objects.filter(**{lookup: value})
+                .values_list('pk', flat=True).order_by().distinct())
+    query, params = services.query.sql_with_params()
+    through = models.Release.services.through._meta
+    with transaction.atomic():
+        release = models.Release.objects.create(name=name)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO %s (%s, %s) SELECT %%s, snapshot.id FROM (%s) '
+                'snapshot' % (
+                    connection.ops.quote_name(through.db_table),
+                    connection.ops.quote_name(
+                        through.get_field('release').column),
+                    connection.ops.quote_name(
+                        through.get_field('service').column),
+                    query),
+                (release.pk, ) + tuple(params))
+            count = cursor.rowcount
+        generation.bump()
+    return release, count
@@ -0,0 +1,86 @@
+"""Sortable keys of version names.
+
+Names are parsed into major, minor and patch numbers, whether they are a
+release, and a suffix: the pre-release tag of "1.2.0-rc1" or "1.2rc1", or
+the trailing text of "1.2.3.4". Numbers in the suffix are zero-padded, so it
+sorts as text. Versions sort by those columns in that order, so
+1.2.0-rc1 < 1.2.0-rc10 < 1.2.0 < 1.2.0.9 < 1.2.0.10 < 1.10.0. Names that do
+not start with a number keep every column NULL: they are left out of the
+range filters.
+"""
+import re
+
+from django.db.models import Q
+
+NUMBERS = re.compile(r'^[vV]?(\d+)(?:\.(\d+))?(?:\.(\d+))?(.*)$')
+
+FIELDS = ('major', 'minor', 'patch', 'release', 'suffix')
+
+# Suffixes are truncated to the column size.
+SUFFIX_LENGTH = 100
+
+# Numbers larger than this fall back to the unparsed form
+MAX_NUMBER = 2 ** 31 - 1
+
+# Digits of the numbers in suffixes, as many as MAX_NUMBER has
+NUMBER_WIDTH = 10
+DIGITS = re.compile(r'\d+')
+
+
+def sortable(suffix):
+    """`suffix` with its numbers zero-padded: "rc9" < "rc10" as text."""
+    return DIGITS.sub(lambda match: match.group().zfill(NUMBER_WIDTH), suffix)
+
+
+def parse(name):
+    """The key columns of `name`, as a dict."""
+    match = NUMBERS.match(name or '')
+    if match is None:
+        return dict.fromkeys(FIELDS)
+    major, minor, patch, rest = match.groups()
+    numbers = [int(number or 0) for number in (major, minor, patch)]
+    if max(numbers) > MAX_NUMBER:
+        return dict.fromkeys(FIELDS)
+    # Build metadata does not take part in the ordering
+    rest = rest.split('+', 1)[0]
+    release = not (rest.startswith('-') or rest[:1].isalpha())
+    suffix = sortable(rest if release else rest.lstrip('-'))
+    return dict(zip(FIELDS, numbers + [release, suffix[:SUFFIX_LENGTH]]))
+
+
+def key(name):
+    """The key of `name` as a tuple, or None when it is not a version."""
+    values = parse(name)
+    if values['major'] is None:
+        return None
+    return tuple(values[field] for field in FIELDS)
+
+
+def ordering(prefix='', descending=False):
+    """order_by() arguments sorting by version, lowest first by default."""
+    return [('-' if descending else '') + prefix + field for field in FIELDS]
+
+
+def compare(prefix, name, lookup):
+    """Q matching the versions below (lt) or above (gt) `name`.
+
+    Compares the key columns as a tuple: (a, b) < (x, y) is expanded into
+    a < x OR (a = x AND b < y). Raises ValueError for non-version names.
+    """
+    values = key(name)
+    if values is None:
+        raise ValueError('Not a version: %s' % name)
+    query, equal = Q(), {}
+    for field, value in zip(FIELDS, values):
+        query |= Q(**dict(equal, **{prefix + field + '__' + lookup: value}))
+        equal[prefix + field] = value
+    return query
+
+
+def exact(prefix, name):
+    """Q matching the versions with the same key as `name`."""
+    values = key(name)
+    if values is None:
+        raise ValueError('Not a version: %s' % name)
+    return Q(**dict((prefix + field, value)
+                    for field, value in zip(FIELDS, values)))
@@ -3,7 +3,56 @@ from generic_relations.relations import GenericRelatedField
 from generic_relations.serializers import GenericModelSerializer
 from django.contrib.auth.models import User
 
-from version import models
+from version import models, releases
+
+
+def sparse_params(request):
+    """The ?fields= and ?expand= of a request, as sets or None."""
+    def names(param):
+        value = request.query_params.get(param)
+        if value is None:
+            return None
+        return set(name.strip() for name in value.split(',') if name.strip())
+    return names('fields'), names('expand')
+
+
+class SparseFieldsMixin(object):
+    """Renders only the ?fields= and the ?expand= relations of the request.
+
+    Without those parameters everything is rendered as usual. With any of
+    them, nested objects not in ?expand= are replaced by their url and nested
+    collections are left out. Only the top level serializer is affected.
+    """
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self.is_top_level():
+            return fields
+        only, expand = sparse_params(request)
+        if only is None and expand is None:
+            return fields
+        for name, field in list(fields.items()):
+            if only is not None and name not in only:
+                del fields[name]
+            elif not isinstance(field, serializers.BaseSerializer):
+                continue
+            elif expand is not None and name in expand:
+                continue
+            # Also drops the nested fields without a relation behind them
+            elif (isinstance(field, serializers.ListSerializer) or
+                  not hasattr(self.Meta.model, name)):
+                del fields[name]
+            else:
+                model = field.Meta.model._meta.model_name
+                fields[name] = serializers.HyperlinkedRelatedField(
+                    view_name='%s-detail' % model, read_only=True)
+        return fields
 
 
 class AttributeSerializer(serializers.ModelSerializer):
@@ -117,7 +166,7 @@ class ServiceSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'id', 'updated', 'arguments', 'component')
 
 
-class ClusterWithDepsSerializer(ClusterSerializer):
+class ClusterWithDepsSerializer(SparseFieldsMixin, ClusterSerializer):
     hosts = HostSerializer(many=True, read_only=True)
 
     class Meta:
@@ -126,7 +175,7 @@ class ClusterWithDepsSerializer(ClusterSerializer):
         depth = 1
 
 
-class HostWithDepsSerializer(HostSerializer):
+class HostWithDepsSerializer(SparseFieldsMixin, HostSerializer):
     cluster = ClusterSerializer(many=False, read_only=True)
 
     class Meta:
@@ -135,14 +184,14 @@ class HostWithDepsSerializer(HostSerializer):
         depth = 1
 
 
-class DeploymentWithDepsSerializer(HostSerializer):
+class DeploymentWithDepsSerializer(SparseFieldsMixin, HostSerializer):
     class Meta:
         model = models.Deployment
         fields = ('url', 'id', 'name', 'label',)
         depth = 1
 
 
-class ApplicationWithDepsSerializer(HostSerializer):
+class ApplicationWithDepsSerializer(SparseFieldsMixin, HostSerializer):
     components = ComponentSerializer(many=True, read_only=True)
     class Meta:
         model = models.Application
@@ -150,7 +199,7 @@ class ApplicationWithDepsSerializer(HostSerializer):
         depth = 1
 
 
-class VersionWithDepsSerializer(HostSerializer):
+class VersionWithDepsSerializer(SparseFieldsMixin, HostSerializer):
     components = ComponentSerializer(many=True, read_only=True)
     services = ServiceSerializer(many=True, read_only=True)
 
@@ -160,7 +209,7 @@ class VersionWithDepsSerializer(HostSerializer):
         depth = 1
 
 
-class ComponentWithDepsSerializer(HostSerializer):
+class ComponentWithDepsSerializer(SparseFieldsMixin, HostSerializer):
     application = ApplicationWithDepsSerializer(many=False, read_only=True)
     version = VersionWithDepsSerializer(many=False, read_only=True)
 
@@ -170,7 +219,8 @@ class ComponentWithDepsSerializer(HostSerializer):
         depth = 1
 
 
-class ServiceWithDepsSerializer(serializers.HyperlinkedModelSerializer):
+class ServiceWithDepsSerializer(SparseFieldsMixin,
+                                serializers.HyperlinkedModelSerializer):
     host = HostSerializer(many=False, read_only=True)
     component = ComponentSerializer(many=False, read_only=True)
     version = VersionSerializer(many=False, read_only=True)
@@ -178,7 +228,49 @@ class ServiceWithDepsSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = models.Service
-        fields = ('url', 'id', 'updated', 'arguments', 'host', 'component', 'version', 'deployment')
+        fields = ('url', 'id', 'updated', 'stale', 'arguments', 'host',
+                  'component', 'version', 'deployment')
+
+
+class VersionChangeSerializer(serializers.HyperlinkedModelSerializer):
+    host = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    deployment = serializers.SlugRelatedField(
+        slug_field='name', read_only=True)
+    application = serializers.SlugRelatedField(
+        slug_field='name', read_only=True)
+    version = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    previous = serializers.SlugRelatedField(slug_field='name', read_only=True)
+
+    class Meta:
+        model = models.VersionChange
+        fields = ('url', 'id', 'created', 'host', 'deployment', 'application',
+                  'previous', 'version')
+
+
+class VersionCountSerializer(serializers.HyperlinkedModelSerializer):
+    application = serializers.SlugRelatedField(
+        slug_field='name', read_only=True)
+    cluster = serializers.SlugRelatedField(slug_field='name', read_only=True)
+    deployment = serializers.SlugRelatedField(
+        slug_field='name', read_only=True)
+    version = serializers.SlugRelatedField(slug_field='name', read_only=True)
+
+    class Meta:
+        model = models.VersionCount
+        fields = ('url', 'id', 'application', 'cluster', 'deployment',
+                  'version', 'services')
+
+
+class ReleaseSerializer(serializers.HyperlinkedModelSerializer):
+    class Meta:
+        model = models.Release
+        fields = ('url', 'id', 'name')
+
+
+class SnapshotSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    kind = serializers.ChoiceField(choices=sorted(releases.KINDS))
+    target = serializers.CharField()
 
 
 class AttributeListSerializer(serializers.ModelSerializer):
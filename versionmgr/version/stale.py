@@ -0,0 +1,28 @@
+"""Flags the services that stopped reporting.
+
+Services not updated since the cutoff are marked stale a chunk at a time,
+walking the (updated, id) index, and the next report of each clears the
+flag again.
+"""
+from version import models, generation
+
+
+def sweep(cutoff, chunk_size):
+    """Flags the services not updated since `cutoff`.
+
+    Every chunk is committed on its own. Returns how many were flagged.
+    """
+    flagged = 0
+    fresh = models.Service.objects.filter(stale=False, updated__lt=cutoff)
+    while True:
+        pks = list(fresh.order_by('updated', 'id')
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        # update() leaves the auto_now `updated` alone. The cutoff is checked
+        # again, for the services that reported since the select.
+        flagged += models.Service.objects.filter(
+            pk__in=pks, stale=False, updated__lt=cutoff).update(stale=True)
+    if flagged:
+        generation.bump()
+    return flagged
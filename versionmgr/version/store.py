@@ -0,0 +1,201 @@
+"""Access to the Redis server that also works as Celery broker.
+
+Everything kept here can be rebuilt from the database, so when Redis is not
+reachable the helpers log the problem and behave as if the keys were missing.
+The ingestion queue is the exception: reports are only queued when `push`
+succeeds, and stay in redis until they are saved.
+"""
+import time
+import logging
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'version:'
+
+_clients = {}
+
+
+def get_client(url=None):
+    url = url or settings.VERSION_REDIS_URL
+    if not url:
+        return None
+    if url not in _clients:
+        _clients[url] = redis.StrictRedis.from_url(
+            url,
+            decode_responses=True,
+            socket_timeout=settings.VERSION_REDIS_TIMEOUT,
+            socket_connect_timeout=settings.VERSION_REDIS_TIMEOUT,
+        )
+    return _clients[url]
+
+
+def get_many(keys):
+    keys = list(keys)
+    client = get_client()
+    if client is None or not keys:
+        return [None] * len(keys)
+    try:
+        return client.mget([PREFIX + key for key in keys])
+    except redis.RedisError:
+        logger.warning("Could not read from redis", exc_info=True)
+        return [None] * len(keys)
+
+
+def set_many(mapping, ttl):
+    client = get_client()
+    if client is None or not mapping:
+        return
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(PREFIX + key, value, ex=ttl)
+        pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+
+
+def push(name, values):
+    """Adds values to a queue read by `take`, oldest first.
+
+    Returns False if the values could not be stored.
+    """
+    client = get_client()
+    if client is None:
+        return False
+    if not values:
+        return True
+    try:
+        client.lpush(PREFIX + name, *values)
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+        return False
+    return True
+
+
+def take(name, target, count):
+    """Moves up to `count` of the oldest values of a queue to `target`.
+
+    Every value is moved atomically, so it is always in one of the lists.
+    Returns the values moved, oldest first.
+    """
+    client = get_client()
+    if client is None or count <= 0:
+        return []
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for _ in range(count):
+            pipeline.rpoplpush(PREFIX + name, PREFIX + target)
+        values = pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not read from redis", exc_info=True)
+        return []
+    return [value for value in values if value is not None]
+
+
+def peek(name):
+    """The values of a list filled by `take`, oldest first."""
+    client = get_client()
+    if client is None:
+        return []
+    try:
+        return list(reversed(client.lrange(PREFIX + name, 0, -1)))
+    except redis.RedisError:
+        logger.warning("Could not read from redis", exc_info=True)
+        return []
+
+
+def replace(name, values):
+    """Replaces the values of a list filled by `take`, oldest first."""
+    client = get_client()
+    if client is None:
+        return
+    try:
+        pipeline = client.pipeline()
+        pipeline.delete(PREFIX + name)
+        if values:
+            pipeline.lpush(PREFIX + name, *values)
+        pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+
+
+def increment(name, field):
+    """Increments a counter of a hash; returns None without redis."""
+    client = get_client()
+    if client is None:
+        return None
+    try:
+        return client.hincrby(PREFIX + name, field)
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+        return None
+
+
+def delete_fields(name, fields):
+    fields = list(fields)
+    client = get_client()
+    if client is None or not fields:
+        return
+    try:
+        client.hdel(PREFIX + name, *fields)
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+
+
+def get_generation(name):
+    client = get_client()
+    if client is None:
+        return None
+    try:
+        return client.get(PREFIX + 'generation:' + name) or '0'
+    except redis.RedisError:
+        logger.warning("Could not read from redis", exc_info=True)
+        return None
+
+
+def bump_generation(name, time_key=None):
+    """Increments a generation, storing the time in `time_key` if given."""
+    client = get_client()
+    if client is None:
+        return
+    try:
+        pipeline = client.pipeline()
+        pipeline.incr(PREFIX + 'generation:' + name)
+        if time_key:
+            pipeline.set(PREFIX + time_key, time.time())
+        pipeline.execute()
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+
+
+def claim_many(keys, ttl):
+    """Sets every key that does not exist yet, expiring in `ttl` seconds.
+
+    Returns whether each key was claimed; all of them without redis.
+    """
+    keys = list(keys)
+    client = get_client()
+    if client is None or not keys:
+        return [True] * len(keys)
+    try:
+        pipeline = client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.set(PREFIX + key, 1, ex=ttl, nx=True)
+        return [bool(claimed) for claimed in pipeline.execute()]
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
+        return [True] * len(keys)
+
+
+def delete_many(keys):
+    keys = list(keys)
+    client = get_client()
+    if client is None or not keys:
+        return
+    try:
+        client.delete(*[PREFIX + key for key in keys])
+    except redis.RedisError:
+        logger.warning("Could not write to redis", exc_info=True)
@@ -0,0 +1,146 @@
+"""Decoding of compressed request bodies (Content-Encoding).
+
+Bodies are decompressed while they are read, and reading fails as soon as the
+decoded data grows over VERSION_INGEST_MAX_DECODED_SIZE for streamed uploads,
+or VERSION_INGEST_MAX_DECODED_BODY_SIZE for bodies read whole, so a small
+compressed upload can not expand into an unbounded amount of memory.
+"""
+import zlib
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd support is optional
+    zstandard = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class DecodingError(ValueError):
+    status_code = 400
+
+
+class UnsupportedEncoding(DecodingError):
+    status_code = 415
+
+
+class PayloadTooLarge(DecodingError):
+    status_code = 413
+
+
+def gzip_reader(stream):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(size):
+        while not decompressor.eof:
+            compressed = decompressor.unconsumed_tail
+            if not compressed:
+                compressed = stream.read(CHUNK_SIZE)
+                if not compressed:
+                    raise DecodingError('Truncated gzip body')
+            data = decompressor.decompress(compressed, size)
+            if data:
+                return data
+        return b''
+    return read
+
+
+def zstd_reader(stream):
+    return zstandard.ZstdDecompressor().stream_reader(stream).read
+
+
+DECODERS = {
+    'gzip': gzip_reader,
+    'x-gzip': gzip_reader,
+}
+DECODING_ERRORS = (zlib.error, )
+
+if zstandard is not None:
+    DECODERS['zstd'] = zstd_reader
+    DECODING_ERRORS += (zstandard.ZstdError, )
+
+
+class DecodedStream(object):
+    """File-like object with the decoded data of another stream.
+
+    The buffer is a bytearray consumed from the front, which CPython does
+    without moving the rest, so reading is linear in the decoded size.
+    """
+    def __init__(self, read, limit):
+        self._read = read
+        self.limit = limit
+        self.total = 0
+        self.buffer = bytearray()
+        # Length of the buffer known to have no newline
+        self.searched = 0
+
+    def _decode(self):
+        try:
+            data = self._read(CHUNK_SIZE)
+        except DECODING_ERRORS as e:
+            raise DecodingError('Could not decode the body: %s' % e)
+        self.total += len(data)
+        if self.total > self.limit:
+            raise PayloadTooLarge('Decoded body larger than %s bytes'
+                                  % self.limit)
+        return data
+
+    def _fill(self):
+        data = self._decode()
+        self.buffer.extend(data)
+        return bool(data)
+
+    def _take(self, size):
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.searched = max(self.searched - size, 0)
+        return data
+
+    def read(self, size=-1):
+        if size < 0:
+            chunks = [self._take(len(self.buffer))]
+            data = self._decode()
+            while data:
+                chunks.append(data)
+                data = self._decode()
+            return b''.join(chunks)
+        while len(self.buffer) < size:
+            if not self._fill():
+                break
+        return self._take(size)
+
+    def readline(self, size=-1):
+        while True:
+            end = self.buffer.find(b'\n', self.searched) + 1
+            if end:
+                break
+            self.searched = len(self.buffer)
+            if 0 <= size <= len(self.buffer) or not self._fill():
+                end = len(self.buffer)
+                break
+        return self._take(end if size < 0 else min(end, size))
+
+
+def content_encoding(request):
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+    return '' if encoding == 'identity' else encoding
+
+
+def request_stream(request, limit=None):
+    """Returns a file-like object with the decoded body of the request."""
+    encoding = content_encoding(request)
+    if not encoding:
+        return request
+    if encoding not in DECODERS:
+        raise UnsupportedEncoding('Unsupported content encoding %s' % encoding)
+    return DecodedStream(DECODERS[encoding](request),
+                         limit or settings.VERSION_INGEST_MAX_DECODED_SIZE)
+
+
+def request_body(request):
+    """The decoded body, held in memory: limited like uncompressed bodies."""
+    if not content_encoding(request):
+        return request.body
+    return request_stream(
+        request, settings.VERSION_INGEST_MAX_DECODED_BODY_SIZE).read()
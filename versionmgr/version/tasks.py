@@ -1,38 +1,43 @@
 from __future__ import absolute_import, unicode_literals
 import json
+from datetime import timedelta
 from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
 
-from version import models
+from version import ingest, metrics, history, stale
 
 @shared_task
+@metrics.tracked('save_version')
 def save_version(request_body, meta):
     data = json.loads(request_body)
-    host, _ = models.Host.objects.get_or_create(
-        name=data.get('host') or meta['REMOTE_HOST']
-    )
-    app, _ = models.Application.objects.get_or_create(
-        name=data['application']
-    )
-    version, _ = models.Version.objects.get_or_create(
-        name=data['version']
-    )
-    deployment, _ = models.Deployment.objects.get_or_create(
-        name=data.get('deployment', "default")
-    )
-    component, _ = models.Component.objects.get_or_create(
-        version=version,
-        application=app,
-    )
-
-    service, created = models.Service.objects.get_or_create(
-        host=host,
-        deployment=deployment,
-        defaults=dict(
-            component=component,
-            arguments=data.get('arguments'),
-        )
-
-    )
-    prev_version = None if created else service.component.version.name
-    service.component = component
-    service.save()
+    ingest.save_report(data, meta)
+
+
+@shared_task
+@metrics.tracked('save_versions')
+def save_versions(reports, meta):
+    ingest.save_reports(reports, meta)
+
+
+@shared_task(ignore_result=True)
+@metrics.tracked('drain_reports')
+def drain_reports():
+    size = settings.VERSION_INGEST_BATCH_SIZE
+    taken = ingest.drain_reports(
+        size, settings.VERSION_INGEST_BATCH_WAIT_MS / 1000.0)
+    if taken == size:
+        drain_reports.delay()
+
+
+@shared_task(ignore_result=True)
+def compact_history():
+    cutoff = timezone.now() - timedelta(
+        days=settings.VERSION_HISTORY_RETENTION_DAYS)
+    history.compact(cutoff, settings.VERSION_HISTORY_CHUNK_SIZE)
+
+
+@shared_task(ignore_result=True)
+def sweep_stale_services():
+    cutoff = timezone.now() - timedelta(hours=settings.VERSION_STALE_HOURS)
+    stale.sweep(cutoff, settings.VERSION_STALE_CHUNK_SIZE)
@@ -0,0 +1,68 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import ingest, generation, store
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([{'host': 'foo', 'application': 'bar',
+                              'version': '1.0'}], {})
+        self.generation = '1'
+        self.redis = {}
+        for target, name, value in (
+                (generation, 'current', lambda: self.generation),
+                (store, 'get_many',
+                 lambda keys: [self.redis.get(key) for key in keys]),
+                (store, 'set_many',
+                 lambda mapping, ttl: self.redis.update(mapping))):
+            patcher = mock.patch.object(target, name, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reads_are_served_from_the_cache(self):
+        first = self.client.get('/api/service/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/service/')
+        assert second.status_code == 200
+        assert second.content == first.content
+        assert second['Content-Type'] == first['Content-Type']
+
+    def test_new_generations_miss(self):
+        self.client.get('/api/host/')
+        ingest.save_reports([{'host': 'baz', 'application': 'bar',
+                              'version': '1.0'}], {})
+        self.generation = '2'
+        response = self.client.get('/api/host/')
+        assert len(response.json()['results']) == 2
+
+    def test_urls_and_formats_are_cached_apart(self):
+        self.client.get('/api/host/')
+        response = self.client.get('/api/host/?fields=id')
+        assert set(response.json()['results'][0]) == {'id'}
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_hosts_are_cached_apart(self):
+        self.client.get('/api/host/', HTTP_HOST='internal:8000')
+        response = self.client.get('/api/host/',
+                                   HTTP_HOST='public.example.org')
+        url = response.json()['results'][0]['url']
+        assert url.startswith('http://public.example.org/')
+
+    def test_pages_are_cached_per_user(self):
+        for name in ('first', 'second'):
+            self.client.force_login(User.objects.create_superuser(
+                name, '%s@example.org' % name, 'pw'))
+            self.client.get('/', HTTP_ACCEPT='text/html')
+        assert len(self.redis) == 2
+
+    def test_errors_are_not_cached(self):
+        self.client.get('/api/host/1000/')
+        assert not self.redis
@@ -0,0 +1,100 @@
+from datetime import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from version import models, ingest, generation
+
+MODIFIED = datetime(2017, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([{'host': 'foo', 'application': 'bar',
+                              'version': '1.0'}], {})
+        self.generation = '1'
+        for name, value in (('current', lambda: self.generation),
+                            ('modified', lambda: MODIFIED)):
+            patcher = mock.patch.object(generation, name, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unchanged_generation_answers_304_without_queries(self):
+        etag = self.client.get('/api/service/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/service/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+    def test_new_generation_renders_again(self):
+        etag = self.client.get('/api/host/')['ETag']
+        self.generation = '2'
+        response = self.client.get('/api/host/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/host/')
+        assert response['Last-Modified'] == 'Wed, 01 Mar 2017 12:00:00 GMT'
+        response = self.client.get(
+            '/api/host/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        assert response.status_code == 304
+
+    def test_etags_depend_on_the_url(self):
+        first = self.client.get('/api/host/')['ETag']
+        assert self.client.get('/api/host/?fields=id')['ETag'] != first
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_etags_depend_on_the_host(self):
+        first = self.client.get('/api/host/', HTTP_HOST='internal:8000')
+        second = self.client.get('/api/host/', HTTP_HOST='public.example.org',
+                                 HTTP_IF_NONE_MATCH=first['ETag'])
+        assert second.status_code == 200
+
+    def test_without_redis_there_are_no_validators(self):
+        self.generation = None
+        generation.modified.side_effect = lambda: None
+        response = self.client.get('/api/host/')
+        assert not response.has_header('ETag')
+
+
+class GenerationBumpTest(TestCase):
+    def test_writes_bump_the_generation(self):
+        with mock.patch.object(generation, 'bump') as bump:
+            cluster = models.Cluster.objects.create(name='c')
+            assert bump.call_count == 1
+            cluster.delete()
+            assert bump.call_count == 2
+
+    @override_settings(VERSION_REDIS_URL=None)
+    def test_ingestion_bumps_the_generation(self):
+        with mock.patch.object(generation, 'bump') as bump:
+            ingest.save_reports([{'host': 'foo', 'application': 'bar',
+                                  'version': '1.0'}], {})
+        assert bump.called
+
+    def check_heartbeats(self, save):
+        report = {'host': 'foo', 'application': 'bar', 'version': '1.0'}
+        save(report)
+        with mock.patch.object(generation, 'bump') as bump:
+            save(report)
+            assert not bump.called
+            models.Service.objects.update(stale=True)
+            save(report)
+            assert bump.call_count == 1
+            save(dict(report, version='2.0'))
+            assert bump.call_count == 2
+
+    @override_settings(VERSION_REDIS_URL=None)
+    def test_heartbeats_keep_the_generation(self):
+        self.check_heartbeats(lambda report: ingest.save_reports([report], {}))
+
+    @override_settings(VERSION_REDIS_URL=None)
+    def test_single_heartbeats_keep_the_generation(self):
+        self.check_heartbeats(lambda report: ingest.save_report(report, {}))
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest
+
+
+def report(host, application, version, deployment='prod'):
+    return {'host': host, 'application': application, 'version': version,
+            'deployment': deployment}
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class DiffTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            report('alpha', 'web', '1.0', 'staging'),
+            report('beta', 'db', '1.0', 'staging'),
+            report('gamma', 'web', '2.0'),
+            report('delta', 'web', '1.0'),
+            report('alpha', 'cache', '3.0'),
+        ], {})
+
+    def diff(self, kind, left, right):
+        response = self.client.get(
+            '/api/diff/%s/?left=%s&right=%s' % (kind, left, right))
+        assert response.status_code == 200
+        return response.json()
+
+    def test_deployments(self):
+        assert self.diff('deployment', 'staging', 'prod') == {
+            'added': [{'application': 'cache', 'versions': ['3.0']}],
+            'removed': [{'application': 'db', 'versions': ['1.0']}],
+            'changed': [{'application': 'web', 'left': ['1.0'],
+                         'right': ['1.0', '2.0']}],
+        }
+
+    def test_clusters(self):
+        for name, hosts in (('east', ['alpha']), ('west', ['gamma'])):
+            cluster = models.Cluster.objects.create(name=name)
+            for host in models.Host.objects.filter(name__in=hosts):
+                host.cluster = cluster
+                host.save()
+        assert self.diff('cluster', 'east', 'west') == {
+            'added': [],
+            'removed': [{'application': 'cache', 'versions': ['3.0']}],
+            'changed': [{'application': 'web', 'left': ['1.0'],
+                         'right': ['2.0']}],
+        }
+
+    def test_releases(self):
+        old = models.Release.objects.create(name='old')
+        old.services.add(
+            *models.Service.objects.filter(deployment__name='staging'))
+        new = models.Release.objects.create(name='new')
+        new.services.add(*models.Service.objects.filter(
+            host__name__in=['alpha', 'beta'], deployment__name='staging'))
+        new.services.add(models.Service.objects.get(host__name='gamma'))
+        assert self.diff('release', old.pk, new.pk) == {
+            'added': [],
+            'removed': [],
+            'changed': [{'application': 'web', 'left': ['1.0'],
+                         'right': ['1.0', '2.0']}],
+        }
+
+    def test_unknown_targets(self):
+        assert self.client.get(
+            '/api/diff/deployment/?left=prod&right=nope').status_code == 404
+        assert self.client.get(
+            '/api/diff/release/?left=x&right=y').status_code == 404
+        assert self.client.get(
+            '/api/diff/deployment/?left=prod').status_code == 400
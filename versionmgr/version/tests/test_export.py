@@ -0,0 +1,59 @@
+import io
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest, export
+
+
+@override_settings(VERSION_REDIS_URL=None, VERSION_EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    def setUp(self):
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'app', 'version': '1.%s' % i,
+             'arguments': '-v, "quoted"'}
+            for i in range(5)
+        ], {})
+        cluster = models.Cluster.objects.create(name='east')
+        models.Host.objects.filter(name='host0').update(cluster=cluster)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_rows_are_read_in_chunks(self):
+        with self.assertNumQueries(3):
+            rows = list(export.rows())
+        assert [row[0] for row in rows] == ['host%s' % i for i in range(5)]
+        assert rows[0][1] == 'east'
+
+    def test_ndjson(self):
+        response = self.client.get('/api/export/ndjson/')
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = [json.loads(line)
+                 for line in self.content(response).splitlines()]
+        assert len(lines) == 5
+        assert lines[0]['version'] == '1.0'
+        assert lines[0]['deployment'] == 'default'
+
+    def test_csv(self):
+        response = self.client.get('/api/export/csv/')
+        rows = list(csv.reader(io.StringIO(self.content(response))))
+        assert rows[0] == list(export.COLUMNS)
+        assert len(rows) == 6
+        assert rows[1][5] == '-v, "quoted"'
+
+    def test_requires_permission(self):
+        response = APIClient().get('/api/export/csv/')
+        assert response.status_code in (401, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_inventory', format='ndjson', stdout=out)
+        assert len(out.getvalue().splitlines()) == 5
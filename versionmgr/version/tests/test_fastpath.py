@@ -0,0 +1,53 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest, views
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class FastListTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'app%s' % (i % 2),
+             'version': '1.%s' % i, 'arguments': '--ñ %s' % i}
+            for i in range(4)
+        ], {})
+        models.Service.objects.filter(pk=1).update(deployment=None)
+        host = models.Host.objects.get(name='host1')
+        host.label = 'first'
+        host.save()
+        models.Attribute.objects.create(content_object=host, name='a',
+                                        value='b')
+        models.Attribute.objects.create(
+            content_object=models.Application.objects.get(name='app0'),
+            name='c', value='d')
+
+    def get(self, url):
+        response = self.client.get(url)
+        assert response.status_code == 200
+        return json.loads(response.content.decode())
+
+    def test_same_documents_as_the_serializer(self):
+        url = '/api/service/?page_size=3'
+        fast = self.get(url)
+        with mock.patch.object(views.ServiceViewSet, 'fast_rows', None):
+            slow = self.get(url)
+        assert fast == slow
+        assert self.get(fast['next']) == self.get(slow['next'])
+
+    def test_fixed_number_of_queries(self):
+        with self.assertNumQueries(3):
+            self.client.get('/api/service/')
+
+    def test_other_formats_use_the_serializer(self):
+        with mock.patch('version.fastpath.service_rows') as rows:
+            self.client.get('/api/service/?fields=id')
+            self.client.get('/api/service/?format=api')
+        assert not rows.called
@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class FilterTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'alpha', 'application': 'web', 'version': '1.0',
+             'deployment': 'prod'},
+            {'host': 'alpha', 'application': 'db', 'version': '2.0',
+             'deployment': 'staging'},
+            {'host': 'beta', 'application': 'web', 'version': '2.0',
+             'deployment': 'prod'},
+        ], {})
+        cluster = models.Cluster.objects.create(name='east')
+        models.Host.objects.filter(name='beta').update(cluster=cluster)
+        customer = models.Customer.objects.create(name='acme')
+        customer.deployments.add(models.Deployment.objects.get(name='prod'))
+
+    def names(self, url, name=lambda row: row['name']):
+        response = self.client.get(url + '&page_size=100')
+        assert response.status_code == 200
+        return sorted(name(row) for row in response.json()['results'])
+
+    def test_services(self):
+        def hosts(query):
+            rows = self.client.get('/api/service/?' + query).json()['results']
+            return sorted(row['host']['name'] for row in rows)
+        assert hosts('application=web') == ['alpha', 'beta']
+        assert hosts('application=web&version=2.0') == ['beta']
+        assert hosts('cluster=east') == ['beta']
+        assert hosts('customer=acme') == ['alpha', 'beta']
+        assert hosts('deployment=staging') == ['alpha']
+        assert hosts('updated_since=2100-01-01T00:00:00') == []
+
+    def test_hosts_match_one_service_with_every_filter(self):
+        assert self.names('/api/host/?application=web') == ['alpha', 'beta']
+        # alpha runs web and some 2.0, but not web 2.0
+        assert self.names('/api/host/?application=web&version=2.0') == [
+            'beta']
+
+    def test_applications_and_components(self):
+        assert self.names('/api/application/?host=beta') == ['web']
+        assert self.names('/api/application/?customer=acme') == ['web']
+        applications = self.names('/api/component/?version=2.0',
+                                  lambda row: row['application']['name'])
+        assert applications == ['db', 'web']
+
+    def test_invalid_time(self):
+        response = self.client.get('/api/service/?updated_since=yesterday')
+        assert response.status_code == 400
+
+    def test_attributes(self):
+        for host, rack in (('alpha', 'R12'), ('beta', 'R13')):
+            models.Attribute.objects.create(
+                content_object=models.Host.objects.get(name=host),
+                name='rack', value=rack)
+        models.Attribute.objects.create(
+            content_object=models.Cluster.objects.get(name='east'),
+            name='region', value='x' * 150)
+        assert self.names('/api/host/?attribute=rack:R12') == ['alpha']
+        assert self.names('/api/host/?attribute=rack:R1') == []
+        assert self.names(
+            '/api/cluster/?attribute=region:' + 'x' * 150) == ['east']
+        assert self.names(
+            '/api/cluster/?attribute=region:' + 'x' * 120) == []
+        response = self.client.get('/api/host/?attribute=rack')
+        assert response.status_code == 400
+
+
+class OrderedAttributesTest(TestCase):
+    def test_prefetched_attributes_are_sorted_without_queries(self):
+        cluster = models.Cluster.objects.create(name='east')
+        for name in ('b', 'c', 'a'):
+            models.Attribute.objects.create(content_object=cluster,
+                                            name=name, value=name)
+        cluster = models.Cluster.objects.prefetch_related(
+            'attributes').get(pk=cluster.pk)
+        with self.assertNumQueries(0):
+            names = [a.name for a in cluster.ordered_attributes()]
+        assert names == ['a', 'b', 'c']
+        assert models.Attribute.objects.get(name='a').value_key == 'a'
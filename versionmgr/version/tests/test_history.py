@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from version import models, ingest, history
+
+META = {'REMOTE_HOST': 'remote'}
+
+
+def report(version, host='foo', application='bar', deployment='default'):
+    return {'host': host, 'application': application, 'version': version,
+            'deployment': deployment}
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class HistoryRecordingTest(TestCase):
+    def versions(self):
+        return list(models.VersionChange.objects.order_by('pk')
+                    .values_list('previous__name', 'version__name'))
+
+    def test_single_reports(self):
+        ingest.save_report(report('1.0'), META)
+        ingest.save_report(report('1.0'), META)
+        ingest.save_report(report('2.0'), META)
+        assert self.versions() == [(None, '1.0'), ('1.0', '2.0')]
+
+    def test_batches(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='baz')], META)
+        ingest.save_reports([report('1.0'), report('2.0', host='baz')], META)
+        assert self.versions() == [
+            (None, '1.0'), (None, '1.0'), ('1.0', '2.0')]
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class HistoryQueriesTest(TestCase):
+    def setUp(self):
+        self.start = timezone.now()
+        for version in ('1.0', '2.0', '3.0'):
+            ingest.save_report(report(version), META)
+        ingest.save_report(report('1.0', deployment='other'), META)
+        self.host = models.Host.objects.get(name='foo')
+        changes = models.VersionChange.objects.order_by('pk')
+        for days, change in enumerate(reversed(list(changes))):
+            change.created = self.start - timedelta(days=days)
+            change.save()
+
+    def test_running_at(self):
+        changes = history.running_at(self.host, self.start - timedelta(days=2))
+        assert [c.version.name for c in changes] == ['2.0']
+        changes = history.running_at(self.host, self.start)
+        assert sorted(c.version.name for c in changes) == ['1.0', '3.0']
+
+    def test_compact_keeps_the_last_change_of_every_service(self):
+        removed = history.compact(self.start - timedelta(hours=12), 1)
+        assert removed == 2
+        names = models.VersionChange.objects.values_list(
+            'version__name', flat=True)
+        assert sorted(names) == ['1.0', '3.0']
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        response = client.get('/api/history/at/', {'host': 'foo'})
+        assert sorted(c['version'] for c in response.data) == ['1.0', '3.0']
+        response = client.get('/api/history/timeline/', {'application': 'bar'})
+        versions = [c['version'] for c in response.data['results']]
+        assert versions == ['1.0', '2.0', '3.0', '1.0']
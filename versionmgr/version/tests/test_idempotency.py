@@ -0,0 +1,76 @@
+import json
+from unittest import mock
+
+from django.test import TestCase, Client
+
+from version import store
+
+
+def claim_many(claimed):
+    def claim(keys, ttl):
+        result = []
+        for key in keys:
+            result.append(key not in claimed)
+            claimed.add(key)
+        return result
+    return claim
+
+
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.claimed = set()
+        patcher = mock.patch.object(store, 'claim_many',
+                                    side_effect=claim_many(self.claimed))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, body, **kwargs):
+        return Client().post(url, body, content_type="application/json",
+                             **kwargs)
+
+    def test_retries_with_the_same_key_are_dropped(self):
+        body = json.dumps({'host': 'foo', 'application': 'bar',
+                           'version': '1'})
+        with mock.patch('version.tasks.save_version.delay') as delay:
+            first = self.post('/version/', body, HTTP_IDEMPOTENCY_KEY='abc')
+            retry = self.post('/version/', body, HTTP_IDEMPOTENCY_KEY='abc')
+            other = self.post('/version/', body, HTTP_IDEMPOTENCY_KEY='def')
+        assert first.status_code == 201
+        assert retry.json()['result'] == 'duplicate'
+        assert other.status_code == 201
+        assert delay.call_count == 2
+
+    def test_report_ids_in_the_body(self):
+        body = json.dumps({'host': 'foo', 'application': 'bar',
+                           'version': '1', 'report_id': 7})
+        with mock.patch('version.tasks.save_version.delay') as delay:
+            self.post('/version/', body)
+            retry = self.post('/version/', body)
+        assert retry.json()['result'] == 'duplicate'
+        assert delay.call_count == 1
+
+    def test_failed_deliveries_release_the_key(self):
+        body = json.dumps({'host': 'foo', 'application': 'bar',
+                           'version': '1'})
+        with mock.patch.object(store, 'delete_many') as delete_many, \
+                mock.patch('version.tasks.save_version.delay',
+                           side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post('/version/', body, HTTP_IDEMPOTENCY_KEY='abc')
+        assert list(delete_many.call_args[0][0]) == list(self.claimed)
+
+    def test_batches_drop_delivered_reports(self):
+        reports = [
+            {'host': 'foo', 'application': 'a', 'version': '1',
+             'report_id': 'r1'},
+            {'host': 'foo', 'application': 'b', 'version': '1',
+             'report_id': 'r2'},
+            {'host': 'foo', 'application': 'c', 'version': '1'},
+        ]
+        with mock.patch('version.tasks.save_versions.delay') as delay:
+            self.post('/version/batch/', json.dumps(reports[:1]))
+            response = self.post('/version/batch/', json.dumps(reports))
+        assert response.json()['count'] == 2
+        assert response.json()['duplicates'] == 1
+        delivered = delay.call_args[0][0]
+        assert [r['application'] for r in delivered] == ['b', 'c']
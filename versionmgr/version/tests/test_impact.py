@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from version import models, ingest
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class ImpactTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'alpha', 'application': 'web', 'version': '1.0',
+             'deployment': 'prod'},
+            {'host': 'beta', 'application': 'web', 'version': '1.0',
+             'deployment': 'prod'},
+            {'host': 'alpha', 'application': 'web', 'version': '2.0',
+             'deployment': 'staging'},
+            {'host': 'gamma', 'application': 'db', 'version': '1.0',
+             'deployment': 'other'},
+        ], {})
+        deployments = dict(
+            (d.name, d) for d in models.Deployment.objects.all())
+        for name, names in (('acme', ['prod', 'staging']),
+                            ('initech', ['staging']),
+                            ('globex', ['other'])):
+            customer = models.Customer.objects.create(name=name)
+            customer.deployments.add(*[deployments[n] for n in names])
+
+    def impact(self, query):
+        response = self.client.get('/api/impact/?' + query)
+        assert response.status_code == 200
+        return [(row['name'], row['deployments'], row['hosts'],
+                 row['services']) for row in response.json()['customers']]
+
+    def test_counts_per_customer(self):
+        assert self.impact('application=web') == [
+            ('acme', 2, 2, 3), ('initech', 1, 1, 1)]
+        assert self.impact('application=web&version=1.0') == [
+            ('acme', 1, 2, 2)]
+        assert self.impact('application=web&version_from=2.0') == [
+            ('acme', 1, 1, 1), ('initech', 1, 1, 1)]
+        assert self.impact('application=nope') == []
+
+    def test_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.impact('application=web&version_below=2.0')
+        assert len([q for q in queries.captured_queries
+                    if 'version_customer' in q['sql']]) == 1
+
+    def test_application_is_required(self):
+        assert self.client.get('/api/impact/').status_code == 400
@@ -0,0 +1,496 @@
+import io
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, transaction
+from django.test import TestCase, Client, override_settings
+
+import json
+
+from version import models, ingest, store, dimensions
+
+META = {'REMOTE_HOST': 'remote'}
+
+
+def reports(count, version='1.0', host='foo'):
+    return [
+        {'host': host, 'application': 'app%s' % i, 'version': version,
+         'deployment': 'deploy%s' % i}
+        for i in range(count)
+    ]
+
+
+class ParseReportsTest(TestCase):
+    def test_json_array(self):
+        body = json.dumps(reports(2)).encode()
+        assert len(ingest.parse_reports(body)) == 2
+
+    def test_ndjson(self):
+        body = '\n'.join(json.dumps(r) for r in reports(3)).encode()
+        assert len(ingest.parse_reports(body)) == 3
+
+    def test_invalid_report(self):
+        with self.assertRaises(ingest.InvalidReport):
+            ingest.parse_reports(b'[{"application": "foo"}]')
+
+    def test_malformed_body(self):
+        with self.assertRaises(ingest.InvalidReport):
+            ingest.parse_reports(b'{"application": ')
+
+    def test_names_must_be_text_or_numbers(self):
+        for name in ({'a': 1}, [1], True):
+            with self.assertRaises(ingest.InvalidReport):
+                ingest.parse_reports(json.dumps(
+                    [dict(reports(1)[0], version=name)]).encode())
+
+
+class NDJSONReaderTest(TestCase):
+    def test_skips_long_lines(self):
+        stream = io.BytesIO(b'{"application": "a", "version": "1"}\n' +
+                            b'x' * 100 + b'\n' +
+                            b'{"application": "b", "version": "1"}\n')
+        reader = ingest.NDJSONReader(stream, max_line_length=50)
+        assert [r['application'] for r in reader] == ['a', 'b']
+        assert reader.rejected == 1
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class SaveReportsTest(TestCase):
+    def test_creates_everything(self):
+        ingest.save_reports(reports(3), META)
+        assert models.Host.objects.count() == 1
+        assert models.Application.objects.count() == 3
+        assert models.Version.objects.count() == 1
+        assert models.Deployment.objects.count() == 3
+        assert models.Component.objects.count() == 3
+        assert models.Service.objects.count() == 3
+
+    def test_updates_in_place(self):
+        ingest.save_reports(reports(3), META)
+        ids = set(models.Service.objects.values_list('pk', flat=True))
+        ingest.save_reports(reports(3, version='2.0'), META)
+        assert set(models.Service.objects.values_list('pk', flat=True)) == ids
+        versions = models.Service.objects.values_list(
+            'component__version__name', flat=True)
+        assert set(versions) == {'2.0'}
+
+    def test_last_report_wins(self):
+        data = reports(1, version='1.0') + reports(1, version='2.0')
+        ingest.save_reports(data, META)
+        service = models.Service.objects.get()
+        assert service.component.version.name == '2.0'
+
+    def test_remote_host_is_the_default(self):
+        ingest.save_reports([{'application': 'a', 'version': '1'}], META)
+        assert models.Service.objects.get().host.name == 'remote'
+
+    def test_numeric_names(self):
+        data = [{'host': 7, 'application': 'a', 'version': 1.2}]
+        ingest.save_reports(data, META)
+        ingest.save_reports(data, META)
+        service = models.Service.objects.get()
+        assert service.host.name == '7'
+        assert service.component.version.name == '1.2'
+        assert service.component.version.minor == 2
+
+    def test_query_count_does_not_depend_on_size(self):
+        ingest.save_reports(reports(50, host='warmup'), META)
+        with self.assertNumQueries(24):
+            ingest.save_reports(reports(5, version='2.0'), META)
+        with self.assertNumQueries(24):
+            ingest.save_reports(reports(50, version='3.0', host='bar'), META)
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class FingerprintTest(TestCase):
+    def setUp(self):
+        ingest.save_reports(reports(3), META)
+        self.rows = [ingest.normalize_report(r, META) for r in reports(3)]
+        self.services = dict(
+            ((s.host.name, s.deployment.name), s.pk)
+            for s in models.Service.objects.all()
+        )
+
+    def stored(self, rows):
+        return ['%s %s' % (ingest.fingerprint(row),
+                           self.services[row['host'], row['deployment']])
+                for row in rows]
+
+    def test_unchanged_reports_only_touch_services(self):
+        with mock.patch.object(store, 'get_many',
+                               return_value=self.stored(self.rows)):
+            # One update for the stale services, one for the rest
+            with self.assertNumQueries(2):
+                assert ingest.skip_unchanged(self.rows) == []
+
+    def test_changed_reports_are_written(self):
+        changed = [ingest.normalize_report(r, META)
+                   for r in reports(3, version='2.0')]
+        with mock.patch.object(store, 'get_many',
+                               return_value=self.stored(self.rows)):
+            assert ingest.skip_unchanged(changed) == changed
+
+    def test_removed_services_are_written(self):
+        models.Service.objects.filter(
+            pk=self.services['foo', 'deploy0']).delete()
+        with mock.patch.object(store, 'get_many',
+                               return_value=self.stored(self.rows)):
+            assert ingest.skip_unchanged(self.rows) == self.rows[:1]
+
+
+class FakeRedis(object):
+    """The strings and lists of a redis server, in a dict."""
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def lpush(self, key, *values):
+        self.data.setdefault(key, [])[:0] = reversed(values)
+
+    def rpoplpush(self, source, target):
+        if not self.data.get(source):
+            return None
+        value = self.data[source].pop()
+        self.lpush(target, value)
+        return value
+
+    def lrange(self, key, start, end):
+        values = self.data.get(key, [])
+        return values[start:len(values) if end == -1 else end + 1]
+
+    def hincrby(self, key, field, amount=1):
+        counts = self.data.setdefault(key, {})
+        counts[field] = counts.get(field, 0) + amount
+        return counts[field]
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+
+class FakePipeline(object):
+    def __init__(self, client):
+        self.client, self.calls = client, []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.client, name), args, kwargs))
+        return call
+
+    def execute(self):
+        return [method(*args, **kwargs)
+                for method, args, kwargs in self.calls]
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class EditedFingerprintTest(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        dimensions.cache.clear()
+        self.addCleanup(dimensions.cache.clear)
+        # TestCase never commits: run the on_commit callbacks right away
+        for patcher in (mock.patch.object(store, 'get_client',
+                                          return_value=self.redis),
+                        mock.patch.object(transaction, 'on_commit',
+                                          lambda callback: callback())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.org', 'pw'))
+
+    def fingerprints(self):
+        return [key for key in self.redis.data if 'fingerprint:' in key]
+
+    def save(self):
+        ingest.save_reports(reports(1), META)
+        return models.Service.objects.get()
+
+    def test_api_edits_are_overwritten_by_the_next_report(self):
+        service = self.save()
+        assert len(self.fingerprints()) == 1
+        response = self.client.patch(
+            '/api/service/%s/' % service.pk, json.dumps({'arguments': 'x'}),
+            content_type='application/json')
+        assert response.status_code == 200
+        assert models.Service.objects.get().arguments == 'x'
+        assert self.save().arguments is None
+
+    def test_deletes_forget_the_fingerprint(self):
+        self.save().delete()
+        assert self.fingerprints() == []
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class UpsertTest(TestCase):
+    def test_returns_the_previous_version(self):
+        report = reports(1)[0]
+        assert ingest.save_report(report, META) is None
+        report['version'] = '2.0'
+        assert ingest.save_report(report, META) == '1.0'
+        assert models.Service.objects.count() == 1
+        assert models.Component.objects.count() == 2
+
+    def test_shares_dimensions_with_batches(self):
+        ingest.save_reports(reports(2), META)
+        report = dict(reports(1)[0], version='2.0')
+        assert ingest.save_report(report, META) == '1.0'
+        assert models.Host.objects.count() == 1
+        assert models.Service.objects.count() == 2
+
+    def test_numeric_names(self):
+        report = {'host': 'foo', 'application': 'a', 'version': 1.2}
+        assert ingest.save_report(report, META) is None
+        assert ingest.save_report(dict(report, version=2), META) == '1.2'
+
+    def test_names_are_unique(self):
+        models.Host.objects.create(name='foo')
+        with self.assertRaises(IntegrityError):
+            models.Host.objects.create(name='foo')
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = dimensions.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class DimensionCacheTest(TestCase):
+    def setUp(self):
+        dimensions.cache.clear()
+        patcher = mock.patch.object(store, 'get_generation', return_value='1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(dimensions.cache.clear)
+
+    def test_known_dimensions_skip_lookups(self):
+        ingest.save_reports(reports(5), META)
+        # Only the service lookup and the touch remain
+        with self.assertNumQueries(5):
+            ingest.save_reports(reports(5), META)
+
+    def test_renames_invalidate_the_cache(self):
+        ingest.save_reports(reports(1), META)
+        assert len(dimensions.cache) > 0
+        host = models.Host.objects.get()
+        host.name = 'renamed'
+        host.save()
+        assert len(dimensions.cache) == 0
+
+
+class BatchEndpointTest(TestCase):
+    def test_enqueues_all_reports_at_once(self):
+        with mock.patch('version.tasks.save_versions.delay') as delay:
+            response = Client().post(
+                '/version/batch/',
+                json.dumps(reports(4)),
+                content_type="application/json",
+            )
+        assert response.status_code == 201
+        assert response.json()['count'] == 4
+        assert delay.call_count == 1
+        assert len(delay.call_args[0][0]) == 4
+
+    @override_settings(VERSION_INGEST_CHUNK_SIZE=3)
+    def test_streams_ndjson_in_chunks(self):
+        body = '\n'.join(json.dumps(r) for r in reports(7))
+        body += '\nnot json\n{"host": "foo"}\n'
+        with mock.patch('version.tasks.save_versions.delay') as delay:
+            response = Client().post(
+                '/version/batch/', body,
+                content_type="application/x-ndjson",
+            )
+        assert response.status_code == 201
+        assert response.json()['count'] == 7
+        assert response.json()['rejected'] == 2
+        sizes = [len(call[0][0]) for call in delay.call_args_list]
+        assert sizes == [3, 3, 1]
+
+    def test_rejects_invalid_reports(self):
+        with mock.patch('version.tasks.save_versions.delay') as delay:
+            response = Client().post(
+                '/version/batch/',
+                '[{"host": "foo"}]',
+                content_type="application/json",
+            )
+        assert response.status_code == 400
+        assert not delay.called
+
+
+@override_settings(VERSION_INGEST_MODE='batch')
+class BatchModeTest(TestCase):
+    def test_reports_are_queued_in_redis(self):
+        with mock.patch.object(store, 'push', return_value=True) as push, \
+                mock.patch('version.tasks.save_version.delay') as delay:
+            response = Client().post(
+                '/version/',
+                json.dumps({'application': 'bar', 'version': '1'}),
+                content_type="application/json",
+                REMOTE_HOST='agent',
+            )
+        assert response.status_code == 201
+        assert not delay.called
+        queued = json.loads(push.call_args[0][1][0])
+        assert queued['host'] == 'agent'
+
+    def test_falls_back_to_tasks_without_redis(self):
+        with mock.patch.object(store, 'push', return_value=False), \
+                mock.patch('version.tasks.save_versions.delay') as delay:
+            Client().post(
+                '/version/',
+                json.dumps({'application': 'bar', 'version': '1'}),
+                content_type="application/json",
+            )
+        assert delay.call_count == 1
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class DrainTest(TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        dimensions.cache.clear()
+        self.addCleanup(dimensions.cache.clear)
+        write_rows = ingest.write_rows
+
+        def failing(rows):
+            if any(row['host'] == 'poison' for row in rows):
+                raise ValueError('Cannot save')
+            if any(row['host'] == 'down' for row in rows):
+                raise OperationalError('Connection refused')
+            return write_rows(rows)
+        for patcher in (
+                mock.patch.object(store, 'get_client',
+                                  return_value=self.redis),
+                mock.patch.object(ingest, 'write_rows', side_effect=failing),
+                mock.patch.object(transaction, 'on_commit',
+                                  lambda callback: callback())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def queue(self, data, queued=None):
+        with mock.patch.object(ingest.time, 'time',
+                               return_value=queued or time.time()):
+            assert ingest.queue_reports(data, {})
+
+    def drain(self):
+        return ingest.drain_reports(10, 0)
+
+    def hosts(self, name):
+        return [json.loads(value)['host']
+                for value in reversed(self.redis.data.get(
+                    store.PREFIX + name, []))]
+
+    def versions(self):
+        return dict(models.Service.objects.values_list(
+            'host__name', 'component__version__name'))
+
+    def test_drain_saves_one_batch(self):
+        self.queue(reports(3) + reports(1, version='2.0'))
+        assert self.drain() == 4
+        assert models.Service.objects.count() == 3
+        service = models.Service.objects.get(deployment__name='deploy0')
+        assert service.component.version.name == '2.0'
+        assert self.hosts(ingest.QUEUE) == []
+        assert self.hosts(ingest.PROCESSING_QUEUE) == []
+        assert self.drain() == 0
+
+    def test_failing_reports_stay_ahead_of_newer_ones(self):
+        self.queue(reports(1) + reports(1, host='poison') +
+                   reports(1, host='other'))
+        assert self.drain() == 3
+        assert sorted(self.versions()) == ['foo', 'other']
+        assert self.hosts(ingest.PROCESSING_QUEUE) == ['poison']
+        self.queue(reports(1, host='new'))
+        self.drain()
+        assert self.hosts(ingest.PROCESSING_QUEUE) == ['poison']
+        assert 'new' in self.versions()
+
+    def test_reports_failing_too_often_are_moved_aside(self):
+        self.queue(reports(1, host='poison'))
+        for attempt in range(ingest.MAX_ATTEMPTS):
+            self.drain()
+        assert self.hosts(ingest.PROCESSING_QUEUE) == []
+        assert self.hosts(ingest.FAILED_QUEUE) == ['poison']
+        assert self.redis.data[store.PREFIX + ingest.ATTEMPTS] == {}
+        out = io.StringIO()
+        call_command('requeue_failed_reports', stdout=out)
+        assert out.getvalue() == '1 reports queued again\n'
+        assert self.hosts(ingest.QUEUE) == ['poison']
+
+    def test_unavailable_databases_do_not_count(self):
+        self.queue(reports(1, host='down') + reports(1))
+        for attempt in range(ingest.MAX_ATTEMPTS + 1):
+            assert self.drain() == 0
+            # The drain backs off, keeping the lock
+            self.redis.delete(store.PREFIX + ingest.DRAIN_LOCK)
+        assert self.hosts(ingest.PROCESSING_QUEUE) == ['down', 'foo']
+        assert self.hosts(ingest.FAILED_QUEUE) == []
+        assert not self.redis.data.get(store.PREFIX + ingest.ATTEMPTS)
+
+    def test_one_drain_at_a_time(self):
+        self.queue(reports(1))
+        store.claim_many([ingest.DRAIN_LOCK], 60)
+        assert self.drain() == 0
+        assert self.hosts(ingest.QUEUE) == ['foo']
+
+    def test_reports_of_crashed_drains_are_saved(self):
+        self.queue(reports(1))
+        store.take(ingest.QUEUE, ingest.PROCESSING_QUEUE, 10)
+        assert self.drain() == 1
+        assert self.versions() == {'foo': '1.0'}
+
+    def test_outdated_reports_are_skipped(self):
+        self.queue(reports(1, version='2.0'), queued=time.time())
+        self.queue(reports(1), queued=time.time() - 60)
+        self.drain()
+        assert self.versions() == {'foo': '2.0'}
+        self.queue(reports(1), queued=time.time() - 30)
+        self.drain()
+        assert self.versions() == {'foo': '2.0'}
+        self.queue(reports(1, version='3.0'))
+        self.drain()
+        assert self.versions() == {'foo': '3.0'}
+
+
+class QueueTest(TestCase):
+    def test_names_longer_than_the_columns_are_rejected(self):
+        for key in ('host', 'application', 'version', 'deployment'):
+            report = dict(reports(1)[0], **{key: 'x' * 101})
+            with self.assertRaises(ingest.InvalidReport):
+                ingest.parse_reports(json.dumps([report]))
+        ingest.parse_reports(
+            json.dumps([dict(reports(1)[0], host='x' * 100)]))
+        with self.assertRaises(ingest.InvalidReport):
+            ingest.normalize_report({'application': 'a', 'version': '1'},
+                                    {'REMOTE_HOST': 'x' * 101})
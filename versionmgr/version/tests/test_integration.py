@@ -1,4 +1,4 @@
-from django.test import TestCase, RequestFactory
+from django.test import TestCase, RequestFactory, override_settings
 from django.test import Client
 from django.contrib.auth.models import AnonymousUser, User
 
@@ -11,6 +11,7 @@ from version import (
 )
 
 
+@override_settings(VERSION_INGEST_MODE='sync', VERSION_REDIS_URL=None)
 class InsertionByPublicAPITest(TestCase):
     def test_basic_insertion(self):
         c = Client()
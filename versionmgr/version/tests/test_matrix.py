@@ -0,0 +1,251 @@
+import io
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, IntegrityError, transaction
+from django.db.models import Count
+from django.test import (TestCase, TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from rest_framework.test import APIClient
+
+from version import models, ingest, matrix, upsert
+
+META = {'REMOTE_HOST': 'remote'}
+
+
+def report(version, host='foo', application='web', deployment='prod'):
+    return {'host': host, 'application': application, 'version': version,
+            'deployment': deployment}
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class MatrixTest(TestCase):
+    def matrix(self):
+        return sorted(models.VersionCount.objects.values_list(
+            'application__name', 'cluster__name', 'deployment__name',
+            'version__name', 'services'), key=str)
+
+    def computed(self):
+        return sorted(
+            models.Service.objects
+            .values_list('component__application__name', 'host__cluster__name',
+                         'deployment__name', 'component__version__name')
+            .annotate(services=Count('id')).order_by(), key=str)
+
+    def test_batches(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='bar'),
+                             report('2.0', host='baz', application='db')],
+                            META)
+        assert self.matrix() == [('db', None, 'prod', '2.0', 1),
+                                 ('web', None, 'prod', '1.0', 2)]
+        ingest.save_reports([report('2.0'), report('1.0', host='bar')], META)
+        assert self.matrix() == [('db', None, 'prod', '2.0', 1),
+                                 ('web', None, 'prod', '1.0', 1),
+                                 ('web', None, 'prod', '2.0', 1)]
+        assert self.matrix() == self.computed()
+
+    def test_single_reports(self):
+        ingest.save_report(report('1.0'), META)
+        ingest.save_report(report('1.0', host='bar'), META)
+        ingest.save_report(report('2.0'), META)
+        ingest.save_report(report('2.0'), META)
+        assert self.matrix() == [('web', None, 'prod', '1.0', 1),
+                                 ('web', None, 'prod', '2.0', 1)]
+
+    def test_cluster_reassignment(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='bar')], META)
+        host = models.Host.objects.get(name='foo')
+        host.cluster = models.Cluster.objects.create(name='east')
+        host.save()
+        assert self.matrix() == [('web', 'east', 'prod', '1.0', 1),
+                                 ('web', None, 'prod', '1.0', 1)]
+        host.cluster = None
+        host.save()
+        assert self.matrix() == [('web', None, 'prod', '1.0', 2)]
+
+    def test_model_writes(self):
+        ingest.save_reports([report('1.0'), report('2.0', host='bar')], META)
+        service = models.Service.objects.get(host__name='foo')
+        service.component = models.Component.objects.get(version__name='2.0')
+        service.save()
+        assert self.matrix() == [('web', None, 'prod', '2.0', 2)]
+        models.Host.objects.get(name='bar').delete()
+        assert self.matrix() == [('web', None, 'prod', '2.0', 1)]
+        service.delete()
+        assert self.matrix() == []
+
+    def test_component_changes(self):
+        ingest.save_reports([report('1.0'), report('2.0', host='bar')], META)
+        component = models.Component.objects.get(version__name='1.0')
+        component.version = models.Version.objects.create(name='1.1')
+        component.save()
+        assert self.matrix() == [('web', None, 'prod', '1.1', 1),
+                                 ('web', None, 'prod', '2.0', 1)]
+        component.application = models.Application.objects.create(name='db')
+        component.save()
+        assert self.matrix() == [('db', None, 'prod', '1.1', 1),
+                                 ('web', None, 'prod', '2.0', 1)]
+        assert self.matrix() == self.computed()
+
+    def test_repeated_refreshes(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='bar')], META)
+        cells = matrix.cells(models.Service.objects.values_list(
+            'host_id', 'deployment_id', 'component_id'))
+        matrix.refresh(cells)
+        matrix.refresh(cells)
+        assert self.matrix() == [('web', None, 'prod', '1.0', 2)]
+
+    def test_moves_do_not_recount(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='bar')], META)
+        with mock.patch.object(matrix, 'refresh', side_effect=AssertionError):
+            ingest.save_reports([report('2.0')], META)
+            ingest.save_report(report('3.0', host='bar'), META)
+        assert self.matrix() == [('web', None, 'prod', '2.0', 1),
+                                 ('web', None, 'prod', '3.0', 1)]
+
+    def test_removed_rows_are_created_again(self):
+        ingest.save_reports([report('1.0')], META)
+        key = models.VersionCount.objects.values_list(*matrix.COLUMNS).get()
+        find, calls = matrix.find, []
+
+        def emptied(keys):
+            found = find(keys)
+            if not calls:
+                models.VersionCount.objects.all().delete()
+            calls.append(found)
+            return found
+        with mock.patch.object(matrix, 'find', emptied):
+            matrix.apply({key: 1})
+        assert calls == [{key: mock.ANY}, {}, {}]
+        assert self.matrix() == [('web', None, 'prod', '1.0', 1)]
+
+    def test_rebuild(self):
+        ingest.save_reports([report('1.0'), report('1.0', host='bar')], META)
+        # Queryset updates send no signals
+        models.Host.objects.filter(name='foo').update(
+            cluster=models.Cluster.objects.create(name='east'))
+        assert self.matrix() != self.computed()
+        out = io.StringIO()
+        call_command('rebuild_matrix', stdout=out)
+        assert out.getvalue() == '2 matrix rows\n'
+        assert self.matrix() == [('web', 'east', 'prod', '1.0', 1),
+                                 ('web', None, 'prod', '1.0', 1)]
+
+    def test_single_reports_retry_conflicts(self):
+        calls = []
+
+        def conflict_once(row):
+            calls.append(row)
+            if len(calls) == 1:
+                raise IntegrityError('duplicate key')
+            return upsert_service(row)
+        upsert_service = upsert.upsert_service
+        with mock.patch.object(upsert, 'upsert_service', conflict_once):
+            ingest.save_report(report('1.0'), META)
+        assert len(calls) == 2
+        assert self.matrix() == [('web', None, 'prod', '1.0', 1)]
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class ConcurrentMatrixTest(TransactionTestCase):
+    def matrix(self):
+        return list(models.VersionCount.objects.values_list(
+            'cluster_id', 'services'))
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_refreshes(self):
+        ingest.save_reports([report('1.0')], META)
+        service = models.Service.objects.get()
+        host_ids = [models.Host.objects.create(name=name).pk
+                    for name in ('bar', 'baz')]
+        cells = matrix.cells([(host_ids[0], service.deployment_id,
+                               service.component_id)])
+        ready = threading.Barrier(len(host_ids))
+        errors = []
+
+        def add_service(host_id):
+            try:
+                with transaction.atomic():
+                    # bulk_create sends no signals: the cell is refreshed
+                    # below, once both services are written
+                    models.Service.objects.bulk_create([models.Service(
+                        host_id=host_id, deployment_id=service.deployment_id,
+                        component_id=service.component_id)])
+                    ready.wait()
+                    matrix.refresh(cells)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=add_service, args=(host_id,))
+                   for host_id in host_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert self.matrix() == [(None, 3)]
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_new_rows(self):
+        ingest.save_reports([report('1.0')], META)
+        service = models.Service.objects.get()
+        deployment = models.Deployment.objects.create(name='staging')
+        host_ids = [models.Host.objects.create(name=name).pk
+                    for name in ('bar', 'baz')]
+        ready = threading.Barrier(len(host_ids))
+        errors = []
+
+        def add_service(host_id):
+            try:
+                with transaction.atomic():
+                    ready.wait()
+                    # The new row has a NULL cluster, which the unique
+                    # constraint does not cover
+                    matrix.add_services([((host_id, deployment.pk,
+                                           service.component_id), 1)])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=add_service, args=(host_id,))
+                   for host_id in host_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert sorted(models.VersionCount.objects.values_list(
+            'deployment_id', 'services')) == sorted([
+                (service.deployment_id, 1), (deployment.pk, 2)])
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class MatrixViewsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'admin', 'admin@example.org', 'pw')
+        ingest.save_reports([
+            report('1.0'), report('2.0', host='bar'),
+            report('1.0', application='db', deployment='staging'),
+        ], META)
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        rows = client.get('/api/matrix/?application=web').json()['results']
+        assert sorted((row['version'], row['services']) for row in rows) == [
+            ('1.0', 1), ('2.0', 1)]
+        assert rows[0]['deployment'] == 'prod'
+
+    def test_dashboard(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/matrix/')
+        assert response.status_code == 200
+        assert response.context['columns'] == [('', 'prod'), ('', 'staging')]
+        assert response.context['table'] == [
+            ('db', [[], [('1.0', 1)]]),
+            ('web', [[('1.0', 1), ('2.0', 1)], []]),
+        ]
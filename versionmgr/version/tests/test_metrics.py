@@ -0,0 +1,38 @@
+from django.test import TestCase, Client, override_settings
+
+import json
+
+from version import metrics
+
+
+def sample(name, **labels):
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(VERSION_INGEST_MODE='sync', VERSION_REDIS_URL=None)
+class MetricsTest(TestCase):
+    def test_endpoint_exposes_ingestion_metrics(self):
+        Client().post(
+            '/version/',
+            json.dumps({'host': 'foo', 'application': 'bar', 'version': '1'}),
+            content_type="application/json",
+        )
+        response = Client().get('/metrics')
+        assert response.status_code == 200
+        content = response.content.decode()
+        assert 'version_request_seconds_count{method="POST"' in content
+        assert 'version_ingest_stage_seconds_count{stage="upsert"}' in content
+
+    def test_failures_are_counted_by_stage(self):
+        @metrics.tracked('test')
+        def task():
+            with metrics.stage('host'):
+                raise ValueError()
+
+        before = sample('version_task_failures_total', task='test',
+                        stage='host')
+        with self.assertRaises(ValueError):
+            task()
+        after = sample('version_task_failures_total', task='test',
+                       stage='host')
+        assert after == before + 1
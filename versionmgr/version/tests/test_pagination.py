@@ -0,0 +1,50 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest, pagination
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'app', 'version': '1.0'}
+            for i in range(7)
+        ], {})
+
+    def walk(self, url):
+        names = []
+        while url:
+            response = self.client.get(url)
+            assert response.status_code == 200
+            page = response.json()
+            assert 'count' not in page
+            names += [row['host']['name'] for row in page['results']]
+            url = page['next']
+        return names
+
+    def test_walks_every_service_once(self):
+        names = self.walk('/api/service/?page_size=3')
+        assert sorted(names) == sorted('host%s' % i for i in range(7))
+
+    def test_services_follow_their_update_time(self):
+        service = models.Service.objects.get(host__name='host0')
+        service.save()
+        names = self.walk('/api/service/?page_size=2')
+        assert names[-1] == 'host0'
+
+    def test_page_size_is_capped(self):
+        pagination.KeysetPagination.max_page_size, previous = (
+            2, pagination.KeysetPagination.max_page_size)
+        self.addCleanup(setattr, pagination.KeysetPagination,
+                        'max_page_size', previous)
+        response = self.client.get('/api/host/?page_size=100')
+        assert len(response.json()['results']) == 2
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/service/?cursor=garbage')
+        assert response.status_code == 404
@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest
+
+# Queries per list page, whatever the number of rows: the page itself and
+# one per prefetched relation.
+BUDGETS = {
+    'cluster': 4,
+    'host': 3,
+    'deployment': 1,
+    'application': 3,
+    'version': 3,
+    'component': 6,
+    'service': 3,
+    'history': 1,
+}
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        self.size = 0
+
+    def grow(self, count):
+        reports = [
+            {'host': 'host%s' % i, 'application': 'app%s' % (i % 3),
+             'version': '1.%s' % i, 'deployment': 'deploy%s' % (i % 2)}
+            for i in range(self.size, self.size + count)
+        ]
+        self.size += count
+        ingest.save_reports(reports, {})
+        cluster = models.Cluster.objects.create(name='cluster%s' % self.size)
+        models.Host.objects.filter(cluster=None).update(cluster=cluster)
+        for model in (models.Cluster, models.Host, models.Application):
+            for instance in model.objects.all():
+                models.Attribute.objects.create(
+                    content_object=instance, name='size%s' % self.size,
+                    value='x')
+
+    def assertBudget(self, endpoint):
+        for count in (1, 4):
+            self.grow(count)
+            with self.assertNumQueries(BUDGETS[endpoint]):
+                response = self.client.get('/api/%s/' % endpoint)
+            assert response.status_code == 200
+
+    def test_cluster(self):
+        self.assertBudget('cluster')
+
+    def test_host(self):
+        self.assertBudget('host')
+
+    def test_deployment(self):
+        self.assertBudget('deployment')
+
+    def test_application(self):
+        self.assertBudget('application')
+
+    def test_version(self):
+        self.assertBudget('version')
+
+    def test_component(self):
+        self.assertBudget('component')
+
+    def test_service(self):
+        self.assertBudget('service')
+
+    def test_history(self):
+        self.assertBudget('history')
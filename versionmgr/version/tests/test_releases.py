@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest, releases
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'web', 'version': '1.0',
+             'deployment': 'prod' if i < 5 else 'staging'}
+            for i in range(8)
+        ], {})
+        cluster = models.Cluster.objects.create(name='east')
+        models.Host.objects.filter(name__in=['host0', 'host5']).update(
+            cluster=cluster)
+        for name in ('acme', 'acme'):
+            customer = models.Customer.objects.create(name=name)
+            customer.deployments.add(
+                models.Deployment.objects.get(name='prod'))
+
+    def hosts(self, release):
+        return sorted(release.services.values_list('host__name', flat=True))
+
+    def test_snapshot_is_one_insert(self):
+        with self.assertNumQueries(5):
+            release, count = releases.snapshot('r1', 'deployment', 'prod')
+        assert count == 5
+        assert self.hosts(release) == ['host%s' % i for i in range(5)]
+
+    def test_kinds(self):
+        release, _ = releases.snapshot('r1', 'cluster', 'east')
+        assert self.hosts(release) == ['host0', 'host5']
+        # Two customers with the same name add every service once
+        release, count = releases.snapshot('r2', 'customer', 'acme')
+        assert count == 5
+        models.Deployment.objects.create(name='empty')
+        release, count = releases.snapshot('r3', 'deployment', 'empty')
+        assert count == 0
+
+    def test_api(self):
+        response = self.client.post('/api/release/snapshot/', {
+            'name': 'r1', 'kind': 'deployment', 'target': 'prod'})
+        assert response.status_code == 201
+        assert response.json()['services'] == 5
+        url = '/api/release/%s/services/' % response.json()['id']
+        page = self.client.get(url + '?page_size=3').json()
+        assert len(page['results']) == 3
+        rest = self.client.get(page['next']).json()
+        assert rest['next'] is None
+        hosts = [row['host']['name']
+                 for row in page['results'] + rest['results']]
+        assert sorted(hosts) == ['host%s' % i for i in range(5)]
+        response = self.client.post('/api/release/snapshot/', {
+            'name': 'r2', 'kind': 'host', 'target': 'host1'})
+        assert response.status_code == 400
+
+    def test_unknown_targets(self):
+        response = self.client.post('/api/release/snapshot/', {
+            'name': 'r1', 'kind': 'deployment', 'target': 'missing'})
+        assert response.status_code == 404
+        assert not models.Release.objects.exists()
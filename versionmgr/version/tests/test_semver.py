@@ -0,0 +1,92 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest, semver
+
+ORDERED = ['0.9', '1.2.0-alpha', '1.2.0-rc1', '1.2rc2', '1.2.0', 'v1.2.0.1',
+           '1.10.0']
+# Numbers in suffixes compare as numbers
+NUMERIC = ['1.0.0-beta', '1.0.0-beta.2', '1.0.0-beta.11', '1.2.3.4',
+           '1.2.3.9', '1.2.3.10', '2.0.0-rc9', '2.0.0-rc10', '2.0.0']
+
+
+class ParseTest(TestCase):
+    def test_keys_sort_like_versions(self):
+        keys = [semver.key(name) for name in reversed(ORDERED)]
+        assert sorted(keys) == [semver.key(name) for name in ORDERED]
+
+    def test_numbers_in_suffixes(self):
+        keys = [semver.key(name) for name in reversed(NUMERIC)]
+        assert sorted(keys) == [semver.key(name) for name in NUMERIC]
+
+    def test_parse(self):
+        assert semver.key('1.2.3-rc.1+build5') == (
+            1, 2, 3, False, 'rc.0000000001')
+        assert semver.key('2016.10') == (2016, 10, 0, True, '')
+        assert semver.key('1.2.3+build5') == semver.key('1.2.3')
+        assert semver.key('latest') is None
+        assert semver.key(None) is None
+        assert semver.key('9' * 20) is None
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class VersionKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+
+    def test_every_writer_sets_the_key(self):
+        ingest.save_reports([{'host': 'a', 'application': 'web',
+                              'version': '1.2.0-rc1'}], {})
+        ingest.save_report({'host': 'b', 'application': 'web',
+                            'version': '1.10.0'}, {})
+        models.Version.objects.create(name='0.9')
+        rows = models.Version.objects.order_by(
+            *semver.ordering()).values_list('name', 'major', 'release')
+        assert list(rows) == [('0.9', 0, True), ('1.2.0-rc1', 1, False),
+                              ('1.10.0', 1, True)]
+
+    def test_ranges_and_latest(self):
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'web', 'version': name}
+            for i, name in enumerate(ORDERED + ['nightly'])
+        ] + [{'host': 'other', 'application': 'db', 'version': '3.0'}], {})
+
+        def hosts(query):
+            rows = self.client.get(
+                '/api/host/?page_size=100&' + query).json()['results']
+            return sorted(row['name'] for row in rows)
+        assert hosts('version_below=1.2.0') == ['host0', 'host1', 'host2',
+                                                'host3']
+        assert hosts('application=web&version_from=1.2.0') == [
+            'host4', 'host5', 'host6']
+        assert hosts('version_from=1.2.0&version_below=1.10') == [
+            'host4', 'host5']
+        assert self.client.get(
+            '/api/host/?version_below=nightly').status_code == 400
+
+        def latest(query):
+            response = self.client.get('/api/version/latest/?' + query)
+            return response.status_code == 200 and response.json()['name']
+        assert latest('application=web') == '1.10.0'
+        assert latest('application=web&version_below=1.2.0') == '1.2rc2'
+        assert latest('application=missing') is False
+
+    def test_numeric_suffixes_in_queries(self):
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'web', 'version': name}
+            for i, name in enumerate(NUMERIC)
+        ], {})
+
+        def versions(query):
+            rows = self.client.get(
+                '/api/version/?page_size=100&' + query).json()['results']
+            return sorted(row['name'] for row in rows)
+        assert versions('version_from=1.2.3.9&version_below=2.0.0') == [
+            '1.2.3.10', '1.2.3.9', '2.0.0-rc10', '2.0.0-rc9']
+        assert versions('version_below=1.0.0-beta.11') == [
+            '1.0.0-beta', '1.0.0-beta.2']
+        response = self.client.get('/api/version/latest/?version_below=2.0.0')
+        assert response.json()['name'] == '2.0.0-rc10'
@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from version import models, ingest
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class SparseFieldsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        ingest.save_reports([
+            {'host': 'host%s' % i, 'application': 'app', 'version': '1.0'}
+            for i in range(3)
+        ], {})
+        ContentType.objects.get_for_models(models.Host, models.Application)
+
+    def results(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        assert response.status_code == 200
+        return response.json()['results']
+
+    def test_fields_restrict_the_output(self):
+        rows = self.results('/api/service/?fields=id,updated', 1)
+        assert [set(row) for row in rows] == [{'id', 'updated'}] * 3
+
+    def test_relations_are_links_unless_expanded(self):
+        rows = self.results('/api/service/?expand=', 1)
+        assert rows[0]['host'].startswith('http://testserver/api/host/')
+        rows = self.results('/api/service/?expand=host', 2)
+        assert rows[0]['host']['name'].startswith('host')
+        assert rows[0]['component'].startswith('http://testserver/api/')
+
+    def test_collections_need_expansion(self):
+        rows = self.results('/api/application/?expand=', 1)
+        assert 'components' not in rows[0]
+        rows = self.results('/api/application/?expand=components', 3)
+        assert len(rows[0]['components']) == 1
+
+    def test_only_loads_the_requested_columns(self):
+        with self.assertNumQueries(1) as context:
+            self.client.get('/api/host/?fields=id,name')
+        sql = context.captured_queries[0]['sql']
+        assert 'label' not in sql
+
+    def test_default_output_is_unchanged(self):
+        rows = self.results('/api/service/', 3)
+        assert rows[0]['component']['application']['name'] == 'app'
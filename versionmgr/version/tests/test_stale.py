@@ -0,0 +1,72 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from version import models, ingest, stale, tasks
+
+
+def report(host, version='1.0'):
+    return {'host': host, 'application': 'web', 'version': version}
+
+
+@override_settings(VERSION_REDIS_URL=None)
+class StaleTest(TestCase):
+    def setUp(self):
+        ingest.save_reports([report('host%s' % i) for i in range(5)], {})
+        models.Service.objects.filter(
+            host__name__in=['host0', 'host1', 'host2']).update(
+            updated=timezone.now() - timedelta(days=10))
+
+    def stale_hosts(self):
+        return sorted(models.Service.objects.filter(stale=True)
+                      .values_list('host__name', flat=True))
+
+    def test_sweep_in_chunks(self):
+        with self.assertNumQueries(5):
+            flagged = stale.sweep(timezone.now() - timedelta(days=1), 2)
+        assert flagged == 3
+        assert self.stale_hosts() == ['host0', 'host1', 'host2']
+        assert stale.sweep(timezone.now() - timedelta(days=1), 2) == 0
+
+    @override_settings(VERSION_STALE_HOURS=24, VERSION_STALE_CHUNK_SIZE=10)
+    def test_task(self):
+        tasks.sweep_stale_services()
+        assert self.stale_hosts() == ['host0', 'host1', 'host2']
+
+    def test_reports_clear_the_flag(self):
+        stale.sweep(timezone.now() - timedelta(days=1), 10)
+        ingest.save_reports([report('host0')], {})
+        ingest.save_reports([report('host1', '2.0')], {})
+        ingest.save_report(report('host2'), {})
+        assert self.stale_hosts() == []
+
+    def test_reports_during_the_sweep_are_not_flagged(self):
+        filter = models.Service.objects.filter
+
+        def report_before_update(*args, **kwargs):
+            if 'pk__in' in kwargs:
+                # host0 reports between the select and the update
+                filter(host__name='host0').update(updated=timezone.now())
+            return filter(*args, **kwargs)
+        with mock.patch.object(models.Service.objects, 'filter',
+                               report_before_update):
+            flagged = stale.sweep(timezone.now() - timedelta(days=1), 10)
+        assert flagged == 2
+        assert self.stale_hosts() == ['host1', 'host2']
+
+    def test_api_filter(self):
+        stale.sweep(timezone.now() - timedelta(days=1), 10)
+        client = APIClient()
+        client.force_authenticate(
+            User.objects.create_superuser('admin', 'admin@example.org', 'pw'))
+        rows = client.get('/api/service/?stale=true').json()['results']
+        assert sorted(row['host']['name'] for row in rows) == [
+            'host0', 'host1', 'host2']
+        assert all(row['stale'] for row in rows)
+        rows = client.get('/api/service/?stale=false').json()['results']
+        assert len(rows) == 2
+        assert client.get('/api/service/?stale=maybe').status_code == 400
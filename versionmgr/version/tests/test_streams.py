@@ -0,0 +1,139 @@
+from unittest import mock
+
+from django.test import TestCase, Client, override_settings
+
+import io
+import gzip
+import json
+
+from version import streams
+
+
+def compress(data):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+class CountingBuffer(bytearray):
+    scanned = copied = 0
+
+    def find(self, sub, start=0):
+        self.scanned += len(self) - start
+        return bytearray.find(self, sub, start)
+
+    def __getitem__(self, index):
+        data = bytearray.__getitem__(self, index)
+        if isinstance(index, slice):
+            self.copied += len(data)
+        return data
+
+
+class DecodedStreamTest(TestCase):
+    def decoded(self, data, limit=1024 * 1024):
+        reader = streams.gzip_reader(io.BytesIO(compress(data)))
+        return streams.DecodedStream(reader, limit)
+
+    def test_read(self):
+        assert self.decoded(b'hello world').read() == b'hello world'
+
+    def test_readline(self):
+        stream = self.decoded(b'one\ntwo\nthree')
+        assert stream.readline() == b'one\n'
+        assert stream.readline(2) == b'tw'
+        assert stream.readline() == b'o\n'
+        assert stream.readline() == b'three'
+        assert stream.readline() == b''
+
+    def test_decompression_bombs_are_stopped(self):
+        stream = self.decoded(b'\0' * 10 * 1024 * 1024, limit=1024 * 1024)
+        with self.assertRaises(streams.PayloadTooLarge):
+            stream.read()
+
+    def counted(self, chunks):
+        """A stream over `chunks` that counts the bytes its buffer scans
+        and copies, and the calls to the decoder."""
+        chunks, calls = iter(chunks), []
+
+        def read(size):
+            calls.append(size)
+            return next(chunks, b'')
+        stream = streams.DecodedStream(read, 1024 * 1024)
+        stream.buffer = CountingBuffer()
+        return stream, calls
+
+    def test_reads_copy_every_byte_once(self):
+        stream, calls = self.counted([b'x' * 1000] * 100)
+        assert stream.read(10) == b'x' * 10
+        assert len(stream.read()) == 100000 - 10
+        assert len(calls) == 101
+        assert stream.buffer.copied == 1000
+        stream, calls = self.counted([b'x' * 1000] * 100)
+        while stream.read(300):
+            pass
+        assert stream.buffer.copied == 100000
+
+    def test_long_lines_are_scanned_once(self):
+        stream, calls = self.counted([b'x' * 1000] * 100 + [b'\nrest'])
+        assert len(stream.readline()) == 100001
+        assert stream.readline() == b'rest'
+        assert stream.buffer.scanned <= 100000 + len(b'\nrest') * 2
+        assert stream.buffer.copied == 100005
+        assert len(calls) == 102
+
+    def test_corrupt_body(self):
+        reader = streams.gzip_reader(io.BytesIO(b'not gzip at all'))
+        with self.assertRaises(streams.DecodingError):
+            streams.DecodedStream(reader, 1024).read()
+
+
+class CompressedRequestTest(TestCase):
+    def post(self, url, body, **kwargs):
+        with mock.patch('version.tasks.save_versions.delay') as delay, \
+                mock.patch('version.tasks.save_version.delay'):
+            response = Client().post(url, body, **kwargs)
+        return response, delay
+
+    def test_gzip_batch(self):
+        data = [{'host': 'h', 'application': 'a%s' % i, 'version': '1'}
+                for i in range(10)]
+        response, delay = self.post(
+            '/version/batch/', compress(json.dumps(data).encode()),
+            content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 201
+        assert len(delay.call_args[0][0]) == 10
+
+    def test_gzip_ndjson_stream(self):
+        body = '\n'.join(
+            json.dumps({'host': 'h', 'application': 'a%s' % i, 'version': '1'})
+            for i in range(10))
+        response, delay = self.post(
+            '/version/batch/', compress(body.encode()),
+            content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 201
+        assert response.json()['count'] == 10
+
+    def test_unsupported_encoding(self):
+        response, _ = self.post(
+            '/version/', b'...', content_type='application/json',
+            HTTP_CONTENT_ENCODING='br')
+        assert response.status_code == 415
+
+    @override_settings(VERSION_INGEST_MAX_DECODED_BODY_SIZE=1024)
+    def test_too_large(self):
+        response, _ = self.post(
+            '/version/', compress(b' ' * 4096),
+            content_type='application/json', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 413
+
+    @override_settings(VERSION_INGEST_MAX_DECODED_BODY_SIZE=1024)
+    def test_streams_are_not_limited_like_bodies(self):
+        body = '\n'.join(
+            json.dumps({'host': 'h', 'application': 'a%s' % i, 'version': '1'})
+            for i in range(100))
+        response, _ = self.post(
+            '/version/batch/', compress(body.encode()),
+            content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip')
+        assert response.status_code == 201
+        assert response.json()['count'] == 100
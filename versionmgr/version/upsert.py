@@ -0,0 +1,193 @@
+"""Single-report ingestion using the database native upserts.
+
+Relies on the unique constraints of the dimension names, of
+(version, application) in components and of (host, deployment) in services.
+`upsert_service` returns the service id together with the component and the
+version it replaced, both None for new services, and whether the service
+changed at all: it is new, or its component, arguments or stale flag
+differ. When the component changes it also appends the VersionChange. New
+versions get their semver key.
+
+Existing names are not touched: each dimension is inserted with ON CONFLICT
+DO NOTHING, whose RETURNING is empty for rows that already exist, and read
+back from the table instead. The rows inserted by the statement are not
+visible to its own SELECTs, so exactly one id comes out of each pair.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from version import semver
+
+
+POSTGRESQL = """
+WITH hi AS (
+    INSERT INTO version_host (name) VALUES (%(host)s)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+), h AS (
+    SELECT id FROM hi
+    UNION ALL
+    SELECT id FROM version_host WHERE name = %(host)s
+), ai AS (
+    INSERT INTO version_application (name) VALUES (%(application)s)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+), a AS (
+    SELECT id FROM ai
+    UNION ALL
+    SELECT id FROM version_application WHERE name = %(application)s
+), vi AS (
+    INSERT INTO version_version (name, major, minor, patch, release, suffix)
+    VALUES (%(version)s, %(major)s, %(minor)s, %(patch)s, %(release)s,
+            %(suffix)s)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+), v AS (
+    SELECT id FROM vi
+    UNION ALL
+    SELECT id FROM version_version WHERE name = %(version)s
+), di AS (
+    INSERT INTO version_deployment (name) VALUES (%(deployment)s)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+), d AS (
+    SELECT id FROM di
+    UNION ALL
+    SELECT id FROM version_deployment WHERE name = %(deployment)s
+), ci AS (
+    INSERT INTO version_component (version_id, application_id)
+    SELECT v.id, a.id FROM v, a
+    ON CONFLICT (version_id, application_id) DO NOTHING
+    RETURNING id
+), c AS (
+    SELECT id FROM ci
+    UNION ALL
+    SELECT id FROM version_component
+    WHERE version_id = (SELECT id FROM v)
+      AND application_id = (SELECT id FROM a)
+), p AS (
+    SELECT ps.component_id, pc.version_id, pv.name, ps.arguments, ps.stale
+    FROM version_service ps
+    JOIN version_component pc ON pc.id = ps.component_id
+    JOIN version_version pv ON pv.id = pc.version_id
+    WHERE ps.host_id = (SELECT id FROM h)
+      AND ps.deployment_id = (SELECT id FROM d)
+), s AS (
+    INSERT INTO version_service
+        (host_id, deployment_id, component_id, arguments, updated, stale)
+    SELECT h.id, d.id, c.id, %(arguments)s, %(now)s, false FROM h, d, c
+    ON CONFLICT (host_id, deployment_id) DO UPDATE SET
+        component_id = EXCLUDED.component_id,
+        arguments = EXCLUDED.arguments,
+        updated = EXCLUDED.updated,
+        stale = false
+    RETURNING id
+), e AS (
+    INSERT INTO version_versionchange
+        (host_id, deployment_id, application_id, version_id, previous_id,
+         created)
+    SELECT h.id, d.id, a.id, v.id, (SELECT version_id FROM p), %(now)s
+    FROM h, d, a, v, c
+    WHERE NOT EXISTS (SELECT 1 FROM p WHERE p.component_id = c.id)
+)
+SELECT
+    (SELECT id FROM s),
+    (SELECT component_id FROM p),
+    (SELECT name FROM p),
+    NOT EXISTS (
+        SELECT 1 FROM p, c
+        WHERE p.component_id = c.id AND NOT p.stale
+          AND p.arguments IS NOT DISTINCT FROM %(arguments)s
+    )
+"""
+
+
+def upsert_service_postgresql(cursor, row, now):
+    params = dict(row, now=now, **semver.parse(row['version']))
+    cursor.execute(POSTGRESQL, params)
+    found = cursor.fetchone()
+    if found[0] is None:
+        # A name committed by another worker after the statement started is
+        # neither inserted nor seen; the next statement sees it.
+        cursor.execute(POSTGRESQL, params)
+        found = cursor.fetchone()
+    return found
+
+
+def upsert_name_sqlite(cursor, table, name, **columns):
+    names = ['name'] + sorted(columns)
+    cursor.execute(
+        'INSERT OR IGNORE INTO %s (%s) VALUES (%s)' % (
+            table, ', '.join(names), ', '.join(['%s'] * len(names))),
+        [name] + [columns[column] for column in names[1:]])
+    cursor.execute('SELECT id FROM %s WHERE name = %%s' % table, [name])
+    return cursor.fetchone()[0]
+
+
+def upsert_service_sqlite(cursor, row, now):
+    host = upsert_name_sqlite(cursor, 'version_host', row['host'])
+    application = upsert_name_sqlite(
+        cursor, 'version_application', row['application'])
+    version = upsert_name_sqlite(cursor, 'version_version', row['version'],
+                                 **semver.parse(row['version']))
+    deployment = upsert_name_sqlite(
+        cursor, 'version_deployment', row['deployment'])
+
+    cursor.execute(
+        'INSERT OR IGNORE INTO version_component (version_id, application_id) '
+        'VALUES (%s, %s)', [version, application])
+    cursor.execute(
+        'SELECT id FROM version_component '
+        'WHERE version_id = %s AND application_id = %s',
+        [version, application])
+    component = cursor.fetchone()[0]
+
+    cursor.execute(
+        'SELECT ps.id, ps.component_id, pc.version_id, pv.name, '
+        '       ps.arguments, ps.stale '
+        'FROM version_service ps '
+        'JOIN version_component pc ON pc.id = ps.component_id '
+        'JOIN version_version pv ON pv.id = pc.version_id '
+        'WHERE ps.host_id = %s AND ps.deployment_id = %s',
+        [host, deployment])
+    previous = cursor.fetchone()
+    changed = (previous is None or previous[1] != component or
+               previous[4] != row['arguments'] or bool(previous[5]))
+    if previous is None:
+        cursor.execute(
+            'INSERT INTO version_service '
+            '(host_id, deployment_id, component_id, arguments, updated, '
+            ' stale) '
+            'VALUES (%s, %s, %s, %s, %s, 0)',
+            [host, deployment, component, row['arguments'], now])
+        service, previous_component, previous_version, previous_name = (
+            cursor.lastrowid, None, None, None)
+    else:
+        service, previous_component, previous_version, previous_name = (
+            previous[:4])
+        cursor.execute(
+            'UPDATE version_service '
+            'SET component_id = %s, arguments = %s, updated = %s, stale = 0 '
+            'WHERE id = %s',
+            [component, row['arguments'], now, service])
+    if previous_component != component:
+        cursor.execute(
+            'INSERT INTO version_versionchange '
+            '(host_id, deployment_id, application_id, version_id, '
+            ' previous_id, created) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            [host, deployment, application, version, previous_version, now])
+    return service, previous_component, previous_name, changed
+
+
+UPSERTS = {
+    'postgresql': upsert_service_postgresql,
+    'sqlite': upsert_service_sqlite,
+}
+
+
+def upsert_service(row):
+    upsert = UPSERTS[connection.vendor]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        return upsert(cursor, row, now)
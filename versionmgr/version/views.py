@@ -3,8 +3,9 @@ import json
 import logging
 import hashlib
 from functools import wraps
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_POST, require_GET
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST, require_GET, condition
+from django.utils.decorators import method_decorator
 from django.shortcuts import render, redirect
 from django.contrib.auth.views import redirect_to_login, logout_then_login
 from django.contrib import auth
@@ -13,53 +14,491 @@ from django.contrib import messages
 from django import db
 from django.core.mail import send_mail
 from django.conf import settings
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.db.models import Prefetch, Q
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets
+from rest_framework.decorators import (
+    list_route, detail_route, api_view, permission_classes,
+)
+from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.response import Response
 
-from version import models, serializers, permissions, tasks
+from version import (
+    models, serializers, permissions, tasks, ingest, streams, metrics, history,
+    idempotency, generation, cache, fastpath, export, diff, semver,
+    releases, impact,
+)
 
 logger = logging.getLogger(__name__)
 
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/jsonlines')
 
-class ClusterViewSet(viewsets.ModelViewSet):
+
+def components():
+    """Components as nested by ComponentSerializer."""
+    return models.Component.objects.select_related('application', 'version')
+
+
+def parse_time(value, name):
+    when = parse_datetime(value)
+    if when is None:
+        raise ValidationError({name: 'Expected an ISO 8601 datetime'})
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def parse_bool(value, name):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValidationError({name: 'Expected true or false'})
+
+
+def inventory_etag(request, *args, **kwargs):
+    value = generation.current()
+    if value is None:
+        return None
+    key = '%s %s %s' % (value, request.build_absolute_uri(),
+                        request.META.get('HTTP_ACCEPT', ''))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def inventory_modified(request, *args, **kwargs):
+    return generation.modified()
+
+
+inventory_condition = method_decorator(
+    condition(inventory_etag, inventory_modified))
+
+
+class ConditionalMixin(object):
+    """Answers 304 to reads while the inventory generation is the same.
+
+    Validating costs a redis lookup, so it happens before any query.
+    """
+    @inventory_condition
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @inventory_condition
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class CachedMixin(object):
+    """Serves reads from the response cache of the inventory generation."""
+    @method_decorator(cache.cache_response)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(cache.cache_response)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class FastListMixin(object):
+    """Renders JSON list GETs from `.values()` rows with `fast_rows`.
+
+    Requests for other formats or with ?fields= or ?expand= go through the
+    serializer, which renders the same documents.
+    """
+    fast_columns = ()
+    fast_rows = None
+
+    def use_fast_list(self, request):
+        return (self.fast_rows is not None and
+                request.accepted_renderer.format == 'json' and
+                serializers.sparse_params(request) == (None, None))
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_list(request):
+            return super().list(request, *args, **kwargs)
+        queryset = (self.filter_queryset(self.get_queryset())
+                    .select_related(None).prefetch_related(None)
+                    .values(*self.fast_columns))
+        page = self.paginate_queryset(queryset)
+        rows = self.fast_rows(page, request)
+        return HttpResponse(
+            fastpath.dumps(self.paginator.get_paginated_data(rows)),
+            content_type='application/json')
+
+
+class SparseQuerysetMixin(object):
+    """Loads only what SparseFieldsMixin serializers render.
+
+    `expansions` maps every nested field to the select_related and the
+    prefetch_related lookups it needs when it is expanded.
+    """
+    expansions = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        only, expand = serializers.sparse_params(self.request)
+        if only is None and expand is None:
+            names = self.expansions
+        else:
+            names = expand or ()
+        for name in names:
+            if name in self.expansions and (only is None or name in only):
+                select, prefetch = self.expansions[name]
+                queryset = queryset.select_related(*select)
+                queryset = queryset.prefetch_related(*prefetch)
+        if only is not None and self.request.method in ('GET', 'HEAD'):
+            queryset = queryset.only(*self.columns(only))
+        return queryset
+
+    def columns(self, names):
+        """The concrete columns behind the rendered fields, links included."""
+        opts = self.queryset.model._meta
+        columns = [opts.pk.name]
+        ordering = getattr(self, 'keyset_ordering', ())
+        for name in list(names) + [field.lstrip('-') for field in ordering]:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.concrete and not field.many_to_many:
+                columns.append(name)
+        return columns
+
+
+def to_many(model, lookup):
+    """Whether `lookup` goes through a relation with many rows per object."""
+    for name in lookup.split('__')[:-1]:
+        field = model._meta.get_field(name)
+        if field.one_to_many or field.many_to_many:
+            return True
+        model = field.related_model
+    return False
+
+
+def attribute_lookups(lookup, value):
+    """Lookups of ?attribute=name:value, using the indexed value prefix."""
+    name, separator, value = value.partition(':')
+    if not separator:
+        raise ValidationError({'attribute': 'Expected name:value'})
+    return {
+        lookup + '__name': name,
+        lookup + '__value_key': value[:models.VALUE_KEY_LENGTH],
+        lookup + '__value': value,
+    }
+
+
+def version_range(lookup, param, value):
+    """Q of ?version_below= (exclusive) or ?version_from= (inclusive)."""
+    prefix = lookup + '__' if lookup else ''
+    try:
+        if param == 'version_below':
+            return semver.compare(prefix, value, 'lt')
+        return (semver.compare(prefix, value, 'gt') |
+                semver.exact(prefix, value))
+    except ValueError:
+        raise ValidationError({param: 'Expected a version number'})
+
+
+VERSION_RANGES = ('version_below', 'version_from')
+
+
+class FilterMixin(object):
+    """Filters by the query parameters in `filters`.
+
+    `filters` maps every parameter to its lookup. All of them go in a single
+    filter() call, so lookups through the same relation match the same row.
+    The version ranges map to the path of the version, compared by its key.
+    """
+    filters = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+        lookups, conditions, used = {}, [], []
+        for param, lookup in self.filters.items():
+            if param not in params:
+                continue
+            value = params[param]
+            used.append(lookup)
+            if param == 'updated_since':
+                value = parse_time(value, param)
+            elif param == 'stale':
+                value = parse_bool(value, param)
+            elif param == 'attribute':
+                lookups.update(attribute_lookups(lookup, value))
+                continue
+            elif param in VERSION_RANGES:
+                conditions.append(version_range(lookup, param, value))
+                continue
+            lookups[lookup] = value
+        if not used:
+            return queryset
+        queryset = queryset.filter(*conditions, **lookups)
+        if any(to_many(queryset.model, lookup) for lookup in used):
+            queryset = queryset.distinct()
+        return queryset
+
+
+class ClusterViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                     SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Cluster.objects.all()
     serializer_class = serializers.ClusterWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    expansions = {
+        'attributes': ((), ('attributes', )),
+        'hosts': ((), ('hosts__attributes', )),
+    }
+    filters = {
+        'cluster': 'name',
+        'attribute': 'attributes',
+    }
 
 
-class HostViewSet(viewsets.ModelViewSet):
+class HostViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                  SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Host.objects.all()
     serializer_class = serializers.HostWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    expansions = {
+        'attributes': ((), ('attributes', )),
+        'cluster': (('cluster', ), ('cluster__attributes', )),
+    }
+    filters = {
+        'application': 'services__component__application__name',
+        'version': 'services__component__version__name',
+        'host': 'name',
+        'cluster': 'cluster__name',
+        'deployment': 'services__deployment__name',
+        'customer': 'services__deployment__customers__name',
+        'updated_since': 'services__updated__gte',
+        'attribute': 'attributes',
+        'version_below': 'services__component__version',
+        'version_from': 'services__component__version',
+    }
 
 
-class DeploymentViewSet(viewsets.ModelViewSet):
+class DeploymentViewSet(ConditionalMixin, CachedMixin, SparseQuerysetMixin,
+                        viewsets.ModelViewSet):
     queryset = models.Deployment.objects.all()
     serializer_class = serializers.DeploymentWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
 
 
-class ApplicationViewSet(viewsets.ModelViewSet):
+class ApplicationViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                         SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Application.objects.all()
     serializer_class = serializers.ApplicationWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    # Prefetched components get their application from the parent object
+    expansions = {
+        'attributes': ((), ('attributes', )),
+        'components': ((), (
+            Prefetch('components', queryset=models.Component.objects
+                     .select_related('version')),
+            # Only needed when the application attributes are not expanded
+            'components__application__attributes',
+        )),
+    }
+    filters = {
+        'application': 'name',
+        'version': 'components__version__name',
+        'host': 'components__services__host__name',
+        'cluster': 'components__services__host__cluster__name',
+        'deployment': 'components__services__deployment__name',
+        'customer': 'components__services__deployment__customers__name',
+        'updated_since': 'components__services__updated__gte',
+        'attribute': 'attributes',
+        'version_below': 'components__version',
+        'version_from': 'components__version',
+    }
 
 
-class VersionViewSet(viewsets.ModelViewSet):
+class VersionViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                     SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Version.objects.all()
     serializer_class = serializers.VersionWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    expansions = {
+        'components': ((), (
+            Prefetch('components', queryset=components()),
+            'components__application__attributes',
+        )),
+    }
+    filters = {
+        'application': 'components__application__name',
+        'version_below': '',
+        'version_from': '',
+    }
+
+    @list_route()
+    def latest(self, request):
+        """The highest version, of ?application= and in the range if given."""
+        versions = (self.filter_queryset(models.Version.objects.all())
+                    .filter(major__isnull=False)
+                    .order_by(*semver.ordering(descending=True)))
+        version = versions.first()
+        if version is None:
+            raise NotFound('No version found')
+        return Response(serializers.VersionSerializer(
+            version, context=self.get_serializer_context()).data)
 
 
-class ComponentViewSet(viewsets.ModelViewSet):
+class ComponentViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                       SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Component.objects.all()
     serializer_class = serializers.ComponentWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    expansions = {
+        'application': (('application', ), (
+            'application__attributes',
+            Prefetch('application__components', queryset=components()),
+        )),
+        'version': (('version', ), (
+            Prefetch('version__components', queryset=components()),
+            'version__components__application__attributes',
+        )),
+        'services': ((), ('services', )),
+    }
+    filters = {
+        'application': 'application__name',
+        'version': 'version__name',
+        'host': 'services__host__name',
+        'cluster': 'services__host__cluster__name',
+        'deployment': 'services__deployment__name',
+        'customer': 'services__deployment__customers__name',
+        'updated_since': 'services__updated__gte',
+        'version_below': 'version',
+        'version_from': 'version',
+    }
 
 
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(ConditionalMixin, CachedMixin, FastListMixin,
+                     FilterMixin, SparseQuerysetMixin, viewsets.ModelViewSet):
     queryset = models.Service.objects.all()
     serializer_class = serializers.ServiceWithDepsSerializer
     permission_classes = (permissions.IsRegistered, )
+    keyset_ordering = ('updated', 'id')
+    fast_columns = fastpath.SERVICE_COLUMNS
+    fast_rows = staticmethod(fastpath.service_rows)
+    expansions = {
+        'host': (('host', ), ('host__attributes', )),
+        'component': (('component__application', 'component__version'),
+                      ('component__application__attributes', )),
+        'deployment': (('deployment', ), ()),
+    }
+    filters = {
+        'application': 'component__application__name',
+        'version': 'component__version__name',
+        'host': 'host__name',
+        'cluster': 'host__cluster__name',
+        'deployment': 'deployment__name',
+        'customer': 'deployment__customers__name',
+        'updated_since': 'updated__gte',
+        'version_below': 'component__version',
+        'version_from': 'component__version',
+        'stale': 'stale',
+    }
+
+
+class VersionChangeViewSet(ConditionalMixin, CachedMixin,
+                           viewsets.ReadOnlyModelViewSet):
+    queryset = (models.VersionChange.objects
+                .select_related('host', 'deployment', 'application',
+                                'version', 'previous')
+                .order_by('-created', '-id'))
+    serializer_class = serializers.VersionChangeSerializer
+    permission_classes = (permissions.IsRegistered, )
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'timeline':
+            return ('created', 'id')
+        return ('-created', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if 'host' in params:
+            queryset = queryset.filter(host__name=params['host'])
+        if 'application' in params:
+            queryset = queryset.filter(application__name=params['application'])
+        if 'since' in params:
+            queryset = queryset.filter(
+                created__gte=parse_time(params['since'], 'since'))
+        if 'until' in params:
+            queryset = queryset.filter(
+                created__lt=parse_time(params['until'], 'until'))
+        return queryset
+
+    @list_route()
+    def at(self, request):
+        """What ran on ?host= at ?time= (now by default)."""
+        host = get_object_or_404(
+            models.Host, name=request.query_params.get('host'))
+        when = request.query_params.get('time')
+        when = parse_time(when, 'time') if when else timezone.now()
+        changes = history.running_at(host, when)
+        return Response(self.get_serializer(changes, many=True).data)
+
+    @list_route()
+    def timeline(self, request):
+        """Rollout of ?application=, oldest change first."""
+        if 'application' not in request.query_params:
+            raise ValidationError(
+                {'application': 'This parameter is required'})
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class VersionCountViewSet(ConditionalMixin, CachedMixin, FilterMixin,
+                          viewsets.ReadOnlyModelViewSet):
+    """Services running each version, by application, cluster and deployment.
+
+    Read from the table kept by version.matrix, without touching services.
+    """
+    queryset = (models.VersionCount.objects
+                .select_related('application', 'cluster', 'deployment',
+                                'version'))
+    serializer_class = serializers.VersionCountSerializer
+    permission_classes = (permissions.IsRegistered, )
+    filters = {
+        'application': 'application__name',
+        'version': 'version__name',
+        'cluster': 'cluster__name',
+        'deployment': 'deployment__name',
+    }
+
+
+class ReleaseViewSet(ConditionalMixin, CachedMixin, viewsets.ModelViewSet):
+    queryset = models.Release.objects.all()
+    serializer_class = serializers.ReleaseSerializer
+    permission_classes = (permissions.IsRegistered, )
+
+    @list_route(methods=['post'])
+    def snapshot(self, request):
+        """Creates a release with every service of a deployment, cluster or
+        customer, given by name in `target`.
+        """
+        data = serializers.SnapshotSerializer(data=request.data)
+        data.is_valid(raise_exception=True)
+        release, count = releases.snapshot(
+            data.validated_data['name'], data.validated_data['kind'],
+            data.validated_data['target'])
+        result = self.get_serializer(release).data
+        result['services'] = count
+        return Response(result, status=201)
+
+    @detail_route()
+    def services(self, request, pk=None):
+        """The services of the release, a page at a time."""
+        services = (models.Service.objects.filter(releases=self.get_object())
+                    .values(*fastpath.SERVICE_COLUMNS))
+        page = self.paginate_queryset(services)
+        return self.get_paginated_response(
+            fastpath.service_rows(page, request))
 
 
 class UnserializationException(Exception):
@@ -67,15 +506,184 @@ class UnserializationException(Exception):
         super().__init__('Expected %s, but got %s' % (expected, got))
 
 
+def request_meta(request):
+    return dict((k, v) for k, v in request.META.items() if isinstance(v, str))
+
+
+def enqueue_reports(reports, meta):
+    if settings.VERSION_INGEST_MODE == 'batch':
+        if ingest.queue_reports(reports, meta):
+            return
+    tasks.save_versions.delay(reports, meta)
+
+
+def error_response(message, status=400, **kwargs):
+    response = JsonResponse(dict(result='error', message=message, **kwargs))
+    response.status_code = status
+    return response
+
+
+def created_response(**kwargs):
+    response = JsonResponse(dict(result='created', **kwargs))
+    response.status_code = 201
+    return response
+
+
+def duplicate_response():
+    return JsonResponse(dict(result='duplicate'))
+
+
+def deliver_report(body, report, meta):
+    if settings.VERSION_INGEST_MODE == 'task':
+        tasks.save_version.delay(body, meta)
+    elif settings.VERSION_INGEST_MODE == 'sync':
+        previous = ingest.save_report(report, meta)
+        return JsonResponse(dict(result='ok', previous=dict(version=previous)))
+    else:
+        enqueue_reports([report], meta)
+    return created_response()
+
+
+def released_on_error(keys, deliver, *args):
+    """Runs `deliver`, forgetting the idempotency keys if it fails."""
+    try:
+        response = deliver(*args)
+    except streams.DecodingError as e:
+        response = error_response(str(e), e.status_code)
+    except ValueError as e:
+        response = error_response(str(e))
+    except Exception:
+        idempotency.release(keys)
+        raise
+    if response.status_code >= 400:
+        idempotency.release(keys)
+    return response
+
+
 @require_POST
 def version_write(request):
-    meta = dict((k, v) for k, v in request.META.items() if isinstance(v, str))
-    tasks.save_version.delay(request.body, meta)
-    response = JsonResponse(dict(result='created'))
-    response.status_code = 201
+    meta = request_meta(request)
+    report = None
+    try:
+        body = streams.request_body(request)
+        # Task mode leaves parsing to the worker unless there is a report id
+        if settings.VERSION_INGEST_MODE != 'task' or b'report_id' in body:
+            report = json.loads(body.decode('utf-8'))
+            ingest.validate_report(report)
+    except streams.DecodingError as e:
+        return error_response(str(e), e.status_code)
+    except ValueError as e:
+        return error_response(str(e))
+    keys = [key for key in (idempotency.request_key(request),
+                            idempotency.report_key(report)) if key]
+    if not all(idempotency.claim(keys)):
+        return duplicate_response()
+    return released_on_error(keys, deliver_report, body, report, meta)
+
+
+@require_POST
+def version_batch_write(request):
+    keys = [key for key in (idempotency.request_key(request), ) if key]
+    if not all(idempotency.claim(keys)):
+        return duplicate_response()
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        return released_on_error(keys, version_stream_write, request)
+    return released_on_error(keys, deliver_reports, request)
+
+
+def enqueue_fresh_reports(reports, meta):
+    """Enqueues the reports not delivered before; returns how many."""
+    fresh, keys = idempotency.fresh_reports(reports)
+    try:
+        if fresh:
+            enqueue_reports(fresh, meta)
+    except Exception:
+        idempotency.release(keys)
+        raise
+    return len(fresh)
+
+
+def deliver_reports(request):
+    reports = ingest.parse_reports(streams.request_body(request))
+    count = enqueue_fresh_reports(reports, request_meta(request))
+    return created_response(count=count, duplicates=len(reports) - count)
+
+
+def version_stream_write(request):
+    """Reads NDJSON uploads line by line, in chunks of bounded size.
+
+    The body is never loaded as a whole, so there is no size limit.
+    """
+    meta = request_meta(request)
+    count = duplicates = 0
+    try:
+        reader = ingest.NDJSONReader(streams.request_stream(request))
+        chunks = ingest.chunked(reader, settings.VERSION_INGEST_CHUNK_SIZE)
+        for chunk in chunks:
+            fresh = enqueue_fresh_reports(chunk, meta)
+            duplicates += len(chunk) - fresh
+            count += fresh
+    except streams.DecodingError as e:
+        return error_response(str(e), e.status_code, count=count)
+    return created_response(count=count, rejected=reader.rejected,
+                            duplicates=duplicates)
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsRegistered, ))
+def export_view(request, kind):
+    response = StreamingHttpResponse(export.lines(kind),
+                                     content_type=export.CONTENT_TYPES[kind])
+    response['Content-Disposition'] = (
+        'attachment; filename="inventory.%s"' % kind)
     return response
 
 
+@api_view(['GET'])
+@permission_classes((permissions.IsRegistered, ))
+@cache.cache_response
+def diff_view(request, kind):
+    """Applications added, removed or changed from ?left= to ?right=.
+
+    Clusters and deployments are given by name and releases by id.
+    """
+    params = request.query_params
+    missing = [name for name in ('left', 'right') if not params.get(name)]
+    if missing:
+        raise ValidationError(dict((name, 'This parameter is required')
+                                   for name in missing))
+    return Response(diff.diff(kind, diff.lookup(kind, params['left']),
+                              diff.lookup(kind, params['right'])))
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsRegistered, ))
+@cache.cache_response
+def impact_view(request):
+    """Customers running ?application=, at ?version= or in a version range.
+    """
+    params = request.query_params
+    if not params.get('application'):
+        raise ValidationError({'application': 'This parameter is required'})
+    condition = Q()
+    for param in VERSION_RANGES:
+        if param in params:
+            condition &= version_range(impact.VERSION, param, params[param])
+    rows = impact.customers(params['application'], params.get('version'),
+                            condition)
+    return Response({'customers': [
+        {'id': row['id'], 'name': row['name'],
+         'deployments': row['deployment_count'], 'hosts': row['host_count'],
+         'services': row['service_count']}
+        for row in rows
+    ]})
+
+
+@require_GET
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 def registerView(request):
     if request.method == 'GET':
         return render(request, 'registration/register.html')
@@ -132,6 +740,7 @@ def registerConfirmView(request, key):
 
 
 @require_GET
+@cache.cache_response(per_user=True)
 def index(request):
     if not request.user.is_authenticated():
         return redirect_to_login(request.get_full_path())
@@ -140,6 +749,32 @@ def index(request):
 
 
 @require_GET
+@cache.cache_response(per_user=True)
+def matrix_view(request):
+    if not request.user.is_authenticated():
+        return redirect_to_login(request.get_full_path())
+
+    ordering = (['application__name', 'cluster__name', 'deployment__name'] +
+                semver.ordering('version__') + ['version__name'])
+    rows = (models.VersionCount.objects
+            .order_by(*ordering)
+            .values_list('application__name', 'cluster__name',
+                         'deployment__name', 'version__name', 'services'))
+    columns, cells = set(), {}
+    for application, cluster, deployment, version, services in rows:
+        columns.add((cluster or '', deployment or ''))
+        cells.setdefault(application, {}).setdefault(
+            (cluster or '', deployment or ''), []).append((version, services))
+    columns = sorted(columns)
+    table = [(application, [cells[application].get(column, [])
+                            for column in columns])
+             for application in sorted(cells)]
+    return render(request, 'matrix.html',
+                  {'columns': columns, 'table': table})
+
+
+@require_GET
+@cache.cache_response(per_user=True)
 def javascript(request):
     if not request.user.is_authenticated():
         return redirect_to_login(request.get_full_path())
@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'version.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -157,6 +158,7 @@ EMAIL_FROM = os.environ.get('EMAIL_FROM', 'root@localhost')
 
 
 REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'version.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.BasicAuthentication',
@@ -172,3 +174,64 @@ CELERY_ENABLE_UTC = True
 
 CELERY_BEAT_MAX_LOOP_INTERVAL = 2
 CELERY_BEAT_SCHEDULER = 'django'
+
+# Redis database for ingestion caches; shares the server with the broker.
+VERSION_REDIS_URL = os.environ.get('VERSION_REDIS_URL', 'redis://redis/2')
+VERSION_REDIS_TIMEOUT = 0.5
+# Seconds a report fingerprint is trusted before writing the report again.
+VERSION_FINGERPRINT_TTL = int(os.environ.get('VERSION_FINGERPRINT_TTL', 3600))
+# Names kept in memory by every worker to avoid dimension lookups.
+VERSION_DIMENSION_CACHE_SIZE = 10000
+
+# "task" sends one celery message per request. "batch" queues the reports in
+# redis and drain_reports saves them in transactions of up to
+# VERSION_INGEST_BATCH_SIZE reports, waiting up to
+# VERSION_INGEST_BATCH_WAIT_MS.
+# "sync" saves single reports in the request and answers the previous version.
+VERSION_INGEST_MODE = os.environ.get('VERSION_INGEST_MODE', 'task')
+VERSION_INGEST_BATCH_SIZE = 500
+VERSION_INGEST_BATCH_WAIT_MS = 200
+# Seconds a drain may take before another one takes over its reports, and
+# seconds to wait before draining again when the database is not available.
+VERSION_INGEST_DRAIN_TIMEOUT = 300
+VERSION_INGEST_RETRY_DELAY = 10
+# Reports per celery message when streaming NDJSON uploads.
+VERSION_INGEST_CHUNK_SIZE = 500
+VERSION_INGEST_MAX_LINE_LENGTH = 64 * 1024
+# Limits for decompressed request bodies (Content-Encoding: gzip or zstd):
+# streamed NDJSON uploads, and bodies read whole, which are kept in memory
+# like the uncompressed ones limited by DATA_UPLOAD_MAX_MEMORY_SIZE.
+VERSION_INGEST_MAX_DECODED_SIZE = 512 * 1024 * 1024
+VERSION_INGEST_MAX_DECODED_BODY_SIZE = 2621440
+# Seconds an Idempotency-Key or report_id is remembered to drop retries.
+VERSION_IDEMPOTENCY_TTL = int(os.environ.get('VERSION_IDEMPOTENCY_TTL', 900))
+# Seconds cached responses live; writes make them stale before that.
+VERSION_RESPONSE_CACHE_TTL = int(
+    os.environ.get('VERSION_RESPONSE_CACHE_TTL', 300))
+
+# Version changes older than this are compacted to the last one per service.
+VERSION_HISTORY_RETENTION_DAYS = int(
+    os.environ.get('VERSION_HISTORY_RETENTION_DAYS', 365))
+VERSION_HISTORY_CHUNK_SIZE = 1000
+
+# Services read per query by the inventory export.
+VERSION_EXPORT_CHUNK_SIZE = 2000
+
+# Services not reported for this long are flagged as stale.
+VERSION_STALE_HOURS = int(os.environ.get('VERSION_STALE_HOURS', 72))
+VERSION_STALE_CHUNK_SIZE = 1000
+
+CELERY_BEAT_SCHEDULE = {
+    'drain-reports': {
+        'task': 'version.tasks.drain_reports',
+        'schedule': 1.0,
+    },
+    'compact-history': {
+        'task': 'version.tasks.compact_history',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'sweep-stale-services': {
+        'task': 'version.tasks.sweep_stale_services',
+        'schedule': 60 * 60.0,
+    },
+}
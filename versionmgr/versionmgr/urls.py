@@ -29,11 +29,22 @@ router.register(r'application', views.ApplicationViewSet)
 router.register(r'version', views.VersionViewSet)
 router.register(r'component', views.ComponentViewSet)
 router.register(r'service', views.ServiceViewSet)
+router.register(r'history', views.VersionChangeViewSet)
+router.register(r'matrix', views.VersionCountViewSet)
+router.register(r'release', views.ReleaseViewSet)
 
 urlpatterns = [
+    url(r'^api/export/(?P<kind>ndjson|csv)/$', views.export_view,
+        name='export'),
+    url(r'^api/diff/(?P<kind>cluster|deployment|release)/$', views.diff_view,
+        name='diff'),
+    url(r'^api/impact/$', views.impact_view, name='impact'),
     url(r'^api/', include(router.urls)),
     url(r'^version/$', views.version_write),
+    url(r'^version/batch/$', views.version_batch_write),
+    url(r'^metrics$', views.metrics_view, name='metrics'),
     url(r'^$', views.index, name="home"),
+    url(r'^matrix/$', views.matrix_view, name="matrix"),
     url(r'^main.js$', views.javascript, name="javascript"),
     url(r'^accounts/', include('django.contrib.auth.urls')),
     url(r'^register/?$', views.registerView, name='register'),